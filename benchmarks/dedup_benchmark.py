@@ -0,0 +1,229 @@
+"""图像查重性能基准
+
+生成可复现的合成图库（含重新编码、缩放、裁剪、翻转、水印等近似重复），
+对 ImageDeduplicator 的各查重方法测量吞吐量、峰值内存以及相对真实分组的
+成对精确率/召回率，结果写为JSON以便跟踪性能回退。
+
+用法:
+    python benchmarks/dedup_benchmark.py --sizes 1000 10000 --output dedup_results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import multiprocessing
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 近似重复的变换类型
+TRANSFORMS = ['reencode', 'rescale', 'crop', 'flip', 'watermark']
+
+# 参与测试的查重方法: 名称 -> (方法, 参数)
+METHODS = {
+    'phash_8': ('hash', {'hash_method': 'phash', 'hash_size': 8, 'threshold': 5}),
+    'phash_12': ('hash', {'hash_method': 'phash', 'hash_size': 12, 'threshold': 11}),
+    'phash_16': ('hash', {'hash_method': 'phash', 'hash_size': 16, 'threshold': 20}),
+    'ahash_8': ('hash', {'hash_method': 'ahash', 'hash_size': 8, 'threshold': 5}),
+    'dhash_8': ('hash', {'hash_method': 'dhash', 'hash_size': 8, 'threshold': 5}),
+    'whash_8': ('hash', {'hash_method': 'whash', 'hash_size': 8, 'threshold': 5}),
+    'sift': ('sift', {'ratio': 0.7, 'min_matches': 10}),
+}
+
+def generate_base_image(rng, size=256):
+    """生成一张由渐变背景和随机几何图形组成的基础图像"""
+    height = int(size * rng.uniform(0.75, 1.25))
+    width = size
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    start, end = rng.integers(0, 256, 3), rng.integers(0, 256, 3)
+    weight = (x * rng.uniform(0, 1) + y * rng.uniform(0, 1))[..., None] / 2
+    image = (start * (1 - weight) + end * weight).astype(np.uint8)
+
+    for _ in range(int(rng.integers(6, 16))):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        shape = rng.integers(0, 3)
+        cx, cy = int(rng.integers(0, width)), int(rng.integers(0, height))
+        extent = int(rng.integers(size // 16, size // 3))
+        if shape == 0:
+            cv2.circle(image, (cx, cy), extent // 2, color, -1)
+        elif shape == 1:
+            cv2.rectangle(image, (cx, cy), (cx + extent, cy + extent // 2), color, -1)
+        else:
+            cv2.line(image, (cx, cy), (int(rng.integers(0, width)), int(rng.integers(0, height))),
+                     color, int(rng.integers(1, 6)))
+    return image
+
+def apply_transform(image, transform, rng):
+    """对基础图像施加一种近似重复变换，返回 (图像, 编码扩展名, 编码参数)"""
+    height, width = image.shape[:2]
+    if transform == 'reencode':
+        return image, '.jpg', [int(cv2.IMWRITE_JPEG_QUALITY), int(rng.integers(30, 80))]
+    if transform == 'rescale':
+        scale = rng.uniform(0.4, 0.8)
+        resized = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+        return resized, '.png', []
+    if transform == 'crop':
+        margin_x = int(width * rng.uniform(0.02, 0.08))
+        margin_y = int(height * rng.uniform(0.02, 0.08))
+        return image[margin_y:height - margin_y, margin_x:width - margin_x].copy(), '.png', []
+    if transform == 'flip':
+        return cv2.flip(image, 1), '.png', []
+    if transform == 'watermark':
+        marked = image.copy()
+        overlay = marked.copy()
+        cv2.putText(overlay, 'SAMPLE', (width // 8, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    width / 200, (255, 255, 255), 2, cv2.LINE_AA)
+        cv2.addWeighted(overlay, 0.4, marked, 0.6, 0, marked)
+        return marked, '.png', []
+    raise ValueError(f"未知变换: {transform}")
+
+def generate_corpus(corpus_dir, count, seed=0, duplicate_ratio=0.3):
+    """生成含近似重复的合成图库，返回清单（已存在时直接复用）"""
+    manifest_path = os.path.join(corpus_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['count'] == count and manifest['seed'] == seed:
+            return manifest
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files, clusters, transforms = [], [], []
+    cluster_id = 0
+    while len(files) < count:
+        base = generate_base_image(rng)
+        variants = [(base, '.png', [], 'original')]
+        if rng.random() < duplicate_ratio:
+            for transform in rng.choice(TRANSFORMS, size=int(rng.integers(1, 4)), replace=False):
+                variants.append(apply_transform(base, transform, rng) + (str(transform),))
+
+        for image, extension, params, transform in variants[:count - len(files)]:
+            file_name = f"img_{len(files):07d}{extension}"
+            cv2.imwrite(os.path.join(corpus_dir, file_name), image, params)
+            files.append(file_name)
+            clusters.append(cluster_id)
+            transforms.append(transform)
+        cluster_id += 1
+
+    manifest = {'count': count, 'seed': seed, 'duplicate_ratio': duplicate_ratio,
+                'files': files, 'clusters': clusters, 'transforms': transforms}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+def pair_count(counts):
+    counts = np.asarray(counts, dtype=np.int64)
+    return int((counts * (counts - 1) // 2).sum())
+
+def pairwise_precision_recall(predicted_groups, true_clusters):
+    """按成对关系计算精确率和召回率，predicted_groups中-1表示未分组"""
+    predicted_groups = np.asarray(predicted_groups, dtype=np.int64)
+    true_clusters = np.asarray(true_clusters, dtype=np.int64)
+    grouped = predicted_groups >= 0
+
+    predicted_pairs = pair_count(np.unique(predicted_groups[grouped], return_counts=True)[1])
+    true_pairs = pair_count(np.unique(true_clusters, return_counts=True)[1])
+    # 同时落在同一预测组和同一真实簇中的成对数量
+    joint = predicted_groups[grouped] * (true_clusters.max() + 1) + true_clusters[grouped]
+    true_positive = pair_count(np.unique(joint, return_counts=True)[1])
+
+    precision = true_positive / predicted_pairs if predicted_pairs else 1.0
+    recall = true_positive / true_pairs if true_pairs else 1.0
+    return precision, recall
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存（字节），不可用时返回None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss)
+    except ImportError:
+        return None
+
+def run_method(corpus_dir, manifest, method_name):
+    """在独立进程中运行单个查重方法，保证峰值内存互不影响"""
+    from image_deduplication import ImageDeduplicator
+
+    kind, params = METHODS[method_name]
+    paths = [os.path.join(corpus_dir, name) for name in manifest['files']]
+    deduplicator = ImageDeduplicator()
+
+    start = time.perf_counter()
+    if kind == 'hash':
+        index = deduplicator.find_duplicate_groups(paths, params['hash_method'], params['threshold'],
+                                                   hash_size=params['hash_size'])
+    else:
+        index = deduplicator.find_duplicate_groups_by_sift(paths, params['ratio'], params['min_matches'])
+    elapsed = time.perf_counter() - start
+
+    precision, recall = pairwise_precision_recall(index.group_ids, manifest['clusters'])
+    return {
+        'method': method_name,
+        'params': params,
+        'images': len(paths),
+        'seconds': elapsed,
+        'images_per_second': len(paths) / elapsed if elapsed else None,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'index_bytes': index.nbytes(),
+        'groups': index.group_count,
+        'precision': precision,
+        'recall': recall,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="图像查重性能基准")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="图库规模")
+    parser.add_argument('--methods', nargs='+', default=list(METHODS.keys()), choices=list(METHODS.keys()))
+    parser.add_argument('--corpus-dir', default='bench_corpus', help="合成图库存放目录")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-sift-images', type=int, default=2000,
+                        help="SIFT为两两匹配，超过此规模时跳过")
+    parser.add_argument('--output', default='dedup_benchmark.json', help="结果JSON路径")
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for size in args.sizes:
+        corpus_dir = os.path.join(args.corpus_dir, f"{size}_{args.seed}")
+        print(f"生成图库: {size} 张 -> {corpus_dir}")
+        manifest = generate_corpus(corpus_dir, size, args.seed)
+
+        for method_name in args.methods:
+            if METHODS[method_name][0] == 'sift' and size > args.max_sift_images:
+                print(f"  跳过 {method_name}: 规模 {size} 超过 --max-sift-images")
+                continue
+            with context.Pool(1) as pool:
+                result = pool.apply(run_method, (corpus_dir, manifest, method_name))
+            result['corpus_size'] = size
+            results.append(result)
+            print(f"  {method_name}: {result['images_per_second']:.1f} 张/秒, "
+                  f"精确率 {result['precision']:.3f}, 召回率 {result['recall']:.3f}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.output}")
+
+if __name__ == '__main__':
+    main()
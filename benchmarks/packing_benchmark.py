@@ -0,0 +1,89 @@
+"""图集装箱性能基准
+
+按多种尺寸分布生成可复现的随机矩形，对 image_packing 中的各装箱算法（含旋转选项）
+测量耗时、页数和装箱效率，结果写为JSON以便跟踪性能回退。
+
+用法:
+    python benchmarks/packing_benchmark.py --counts 1000 10000 --output packing_results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_packing import PACKERS, pack_rects, packing_efficiency
+
+def generate_sizes(distribution, count, rng):
+    """生成矩形尺寸: uniform 均匀分布, sprites 长尾分布（大量小图标+少量大图）, strips 细长条"""
+    if distribution == 'uniform':
+        return rng.integers(8, 128, (count, 2))
+    if distribution == 'sprites':
+        return np.clip((rng.pareto(2.5, (count, 2)) * 24 + 8).astype(np.int64), 1, 300)
+    if distribution == 'strips':
+        long_side = rng.integers(64, 400, count)
+        short_side = rng.integers(4, 24, count)
+        horizontal = rng.random(count) < 0.5
+        return np.stack((np.where(horizontal, long_side, short_side),
+                         np.where(horizontal, short_side, long_side)), axis=1)
+    raise ValueError(f"未知尺寸分布: {distribution}")
+
+DISTRIBUTIONS = ['uniform', 'sprites', 'strips']
+
+def main():
+    parser = argparse.ArgumentParser(description="图集装箱性能基准")
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000], help="矩形数量")
+    parser.add_argument('--methods', nargs='+', default=list(PACKERS.keys()), choices=list(PACKERS.keys()))
+    parser.add_argument('--distributions', nargs='+', default=DISTRIBUTIONS, choices=DISTRIBUTIONS)
+    parser.add_argument('--page-size', type=int, default=2048)
+    parser.add_argument('--padding', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='packing_benchmark.json', help="结果JSON路径")
+    args = parser.parse_args()
+
+    results = []
+    for distribution in args.distributions:
+        for count in args.counts:
+            sizes = generate_sizes(distribution, count, np.random.default_rng(args.seed))
+            for method in args.methods:
+                for allow_rotation in (False, True):
+                    start = time.perf_counter()
+                    placements, page_count = pack_rects(sizes, args.page_size, args.page_size, method,
+                                                        allow_rotation, args.padding)
+                    elapsed = time.perf_counter() - start
+                    efficiency = packing_efficiency(sizes, placements, page_count)
+                    results.append({
+                        'distribution': distribution,
+                        'count': count,
+                        'method': method,
+                        'rotation': allow_rotation,
+                        'seconds': elapsed,
+                        'rects_per_second': count / elapsed if elapsed else None,
+                        'pages': page_count,
+                        'efficiency': efficiency,
+                    })
+                    print(f"{distribution:8s} {count:7d} {method:8s} 旋转={'是' if allow_rotation else '否'}: "
+                          f"{elapsed:.2f} 秒, {page_count} 页, 效率 {efficiency:.1%}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'page_size': args.page_size,
+        'padding': args.padding,
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.output}")
+
+if __name__ == '__main__':
+    main()
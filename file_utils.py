@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+# 普通新建文件的权限；mkstemp固定以0600创建，发布前需改为按umask计算的权限。
+# umask只能通过设置来读取，在导入时（主线程启动阶段）读取一次
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+
+def write_temp_file(data, directory):
+    """把data写入directory下的临时文件并设为普通新建文件的权限，返回临时文件路径
+
+    data可以是bytes或任何支持缓冲区协议的对象（如memoryview、NumPy数组），写入时不复制。
+    """
+    fd, temp_path = tempfile.mkstemp(dir=directory or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(memoryview(data))
+        os.chmod(temp_path, FILE_MODE)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+
+def write_file_atomic(data, output_path):
+    """先写临时文件再原子替换，多个进程同时写同一文件时不会留下半截内容"""
+    temp_path = write_temp_file(data, os.path.dirname(output_path))
+    try:
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def write_new_file_atomic(data, candidate_paths):
+    """写入candidate_paths中第一个尚不存在的路径，从不覆盖已有文件，返回最终路径
+
+    候选路径需在同一目录下。硬链接在目标已存在时失败，因此多个进程同时写同名文件也不会互相覆盖；
+    不支持硬链接的文件系统上先独占创建占位文件，再用临时文件原子替换。
+    """
+    candidate_paths = iter(candidate_paths)
+    output_path = next(candidate_paths)
+    temp_path = write_temp_file(data, os.path.dirname(output_path))
+    try:
+        while True:
+            try:
+                try:
+                    os.link(temp_path, output_path)
+                except FileExistsError:
+                    raise
+                except OSError:
+                    open(output_path, 'xb').close()
+                    os.replace(temp_path, output_path)
+                return output_path
+            except FileExistsError:
+                output_path = next(candidate_paths)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
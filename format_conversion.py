@@ -1,9 +1,12 @@
 import os
+import io
 import shutil
 from PIL import Image
+from output_cache import OutputCache
+from file_utils import write_file_atomic
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                             QFileDialog, QListWidget, QLabel, QComboBox, QGroupBox,
-                            QGridLayout, QSizePolicy, QSpacerItem, QProgressBar, QMessageBox)
+                            QGridLayout, QSizePolicy, QSpacerItem, QProgressBar, QMessageBox, QCheckBox)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap
 
@@ -11,14 +14,21 @@ from PyQt5.QtGui import QPixmap
 class FormatConverter:
     """核心格式转换处理器"""
     SUPPORTED_FORMATS = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.dds']
+    CACHE_CHECKPOINT_INTERVAL = 100  # 每记录这么多个输出把新条目追加到缓存日志，中途中断时已完成的部分仍可跳过
     
     def __init__(self):
         self.output_dir = ""
         self.preview_image = None
+        self.output_cache = None  # OutputCache，不为空时跳过输入和参数都未变化的文件
+        self.stored_count = 0
         
     def set_output_dir(self, path):
         self.output_dir = path
         
+    def set_output_cache(self, cache):
+        self.output_cache = cache
+        self.stored_count = 0
+        
     def convert_image(self, input_path, output_format):
         """执行单张图片格式转换"""
         try:
@@ -26,6 +36,13 @@ class FormatConverter:
             if not os.path.exists(input_path):
                 return None
                 
+            # 已有相同参数的转换结果且原图未修改时直接返回
+            cache_params = {'format': output_format.lower()}
+            if self.output_cache is not None:
+                cached = self.output_cache.lookup(input_path, 'convert', cache_params)
+                if cached:
+                    return cached[0]
+                
             filename = os.path.basename(input_path)
             name, ext = os.path.splitext(filename)
             
@@ -33,12 +50,20 @@ class FormatConverter:
             if not os.path.exists(self.output_dir):
                 os.makedirs(self.output_dir)
                 
+            # 原图修改后写回上次记录的输出路径，输出文件名保持不变
+            previous_outputs = []
+            if self.output_cache is not None:
+                previous_outputs = self.output_cache.recorded_outputs(input_path, 'convert', cache_params)
+
             # 防重复名称处理
-            output_path = os.path.join(self.output_dir, f"{name}.{output_format}")
-            counter = 1
-            while os.path.exists(output_path):
-                output_path = os.path.join(self.output_dir, f"{name}_{counter}.{output_format}")
-                counter += 1
+            if previous_outputs:
+                output_path = previous_outputs[0]
+            else:
+                output_path = os.path.join(self.output_dir, f"{name}.{output_format}")
+                counter = 1
+                while os.path.exists(output_path):
+                    output_path = os.path.join(self.output_dir, f"{name}_{counter}.{output_format}")
+                    counter += 1
                 
             # 使用上下文管理器确保文件正确关闭
             with Image.open(input_path) as img:
@@ -74,7 +99,18 @@ class FormatConverter:
                 elif output_format.lower() in ['tiff']:
                     save_params['compression'] = 'tiff_lzw'  # 设置TIFF压缩
                 
-                img.save(output_path, format=output_format.upper(), **save_params)
+                if previous_outputs:
+                    # 覆盖已有输出时先写临时文件再原子替换，中断时不会留下半截文件
+                    buffer = io.BytesIO()
+                    img.save(buffer, format=output_format.upper(), **save_params)
+                    write_file_atomic(buffer.getbuffer(), output_path)
+                else:
+                    img.save(output_path, format=output_format.upper(), **save_params)
+            if self.output_cache is not None:
+                self.output_cache.store(input_path, 'convert', cache_params, output_path)
+                self.stored_count += 1
+                if self.stored_count % self.CACHE_CHECKPOINT_INTERVAL == 0:
+                    self.output_cache.checkpoint()
             return output_path
                 
         except Exception as e:
@@ -86,6 +122,8 @@ class FormatConverter:
         results = []
         for file_path in file_list:
             results.append(self.convert_image(file_path, output_format))
+        if self.output_cache is not None:
+            self.output_cache.save()
         return results
 
 class FormatConversionController(QWidget):
@@ -146,6 +184,10 @@ class FormatConversionController(QWidget):
         self.output_dir_label = QLabel("未选择输出目录", self)
         format_layout.addWidget(self.output_dir_label, 2, 0, 1, 2)
         
+        self.cb_skip_unchanged = QCheckBox("跳过未变化的文件", self)
+        self.cb_skip_unchanged.setToolTip("输出目录中已有相同格式的转换结果且原图未修改时不再重复转换")
+        format_layout.addWidget(self.cb_skip_unchanged, 3, 0, 1, 2)
+        
         format_group.setLayout(format_layout)
         control_layout.addWidget(format_group)
         
@@ -322,6 +364,8 @@ class FormatConversionController(QWidget):
             return
             
         output_format = self.format_combo.currentText()
+        cache = OutputCache(self.converter.output_dir) if self.cb_skip_unchanged.isChecked() else None
+        self.converter.set_output_cache(cache)
         
         # 禁用按钮防止重复操作
         self.btn_convert.setEnabled(False)
@@ -348,6 +392,9 @@ class FormatConversionController(QWidget):
             if result is None:
                 QMessageBox.warning(self, "转换失败", f"文件 {os.path.basename(file_path)} 转换失败")
         
+        if cache is not None:
+            cache.save()
+        
         # 更新进度条到完成状态
         self.progress_bar.setValue(len(self.current_files))
         
@@ -362,7 +409,10 @@ class FormatConversionController(QWidget):
         
         # 统计成功转换的文件数
         success_count = len([r for r in results if r is not None])
-        self.status_label.setText(f"转换完成! 成功转换 {success_count}/{len(self.current_files)} 个文件")
+        status = f"转换完成! 成功转换 {success_count}/{len(self.current_files)} 个文件"
+        if cache is not None:
+            status += f"，{cache.hits} 个未变化已跳过（缓存命中率 {cache.hit_rate():.0%}）"
+        self.status_label.setText(status)
         
         if success_count == len(self.current_files):
             QMessageBox.information(self, "完成", f"所有文件转换成功!")
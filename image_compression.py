@@ -1,32 +1,356 @@
 import os
+import io
 import cv2
 import numpy as np
+import hashlib
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image
+from output_cache import OutputCache
+from file_utils import write_file_atomic, write_new_file_atomic
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
-                             QFileDialog, QListWidget, QListWidgetItem, QSlider, QMessageBox, QCheckBox, QComboBox)
+                             QFileDialog, QListWidget, QListWidgetItem, QSlider, QMessageBox, QCheckBox, QComboBox,
+                             QProgressBar, QSpinBox, QDoubleSpinBox, QLineEdit)
 from PyQt5.QtGui import QPixmap, QImage
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+
+# 有质量参数、可以按目标大小搜索的格式
+LOSSY_FORMATS = ("jpg", "jpeg", "webp")
+# 输出格式对应的文件扩展名（PNG8为调色板PNG）
+FILE_EXTENSIONS = {"png8": "png"}
+
+# JPEG解码时可直接缩小的倍数及对应的OpenCV读取标志（libjpeg按DCT缩放解码）
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def parse_variants(text, default_quality=75):
+    """解析多格式输出设置，如 "jpg:80, webp:75, png"，未写质量时使用default_quality
+
+    返回 [(格式, 质量)]，格式不受支持或质量不是整数时抛出ValueError。
+    """
+    variants = []
+    for part in text.replace('，', ',').split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        output_format, _, quality = part.partition(':')
+        output_format = output_format.strip().lstrip('.')
+        if output_format not in ("jpg", "jpeg", "png", "png8", "webp"):
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        quality = int(quality) if quality.strip() else default_quality
+        variants.append((output_format, min(100, max(1, quality))))
+    if not variants:
+        raise ValueError("未指定输出格式")
+    return variants
+
+SSIM_SIZE = 512  # 计算SSIM的亮度平面最长边
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+def luminance_plane(image, size=SSIM_SIZE):
+    """取亮度通道并用区域插值缩小到最长边不超过size，返回float32数组"""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return image.astype(np.float32)
+
+def compute_ssim(reference, candidate, window=SSIM_WINDOW):
+    """平均SSIM，局部均值和方差均用盒式滤波一次性计算"""
+    def box(values):
+        return cv2.boxFilter(values, -1, (window, window), borderType=cv2.BORDER_REFLECT)
+
+    mu_x, mu_y = box(reference), box(candidate)
+    mu_xx, mu_yy, mu_xy = mu_x * mu_x, mu_y * mu_y, mu_x * mu_y
+    sigma_x = box(reference * reference) - mu_xx
+    sigma_y = box(candidate * candidate) - mu_yy
+    sigma_xy = box(reference * candidate) - mu_xy
+    ssim_map = ((2 * mu_xy + SSIM_C1) * (2 * sigma_xy + SSIM_C2) /
+                ((mu_xx + mu_yy + SSIM_C1) * (sigma_x + sigma_y + SSIM_C2)))
+    return float(ssim_map.mean())
+
+# PNG8调色板模式：颜色量化后写8位（或更少位）索引PNG，透明度写入tRNS。
+# 量化在每通道5位的稀疏颜色直方图上进行，像素按所在直方图格映射到调色板；单核上256x256的UI素材
+# （渐变+抗锯齿，数万种颜色）约100张/秒，64x64约300张/秒，约为Pillow FASTOCTREE的三分之一到四分之一
+PALETTE_KMEANS_ITERATIONS = 2  # 中位切分后k-means细化的轮数
+NEAREST_CHUNK = 2048  # 求最近调色板颜色时每批处理的颜色数，中间结果保持在缓存内
+BAYER_8 = np.array([[0, 32, 8, 40, 2, 34, 10, 42],
+                    [48, 16, 56, 24, 50, 18, 58, 26],
+                    [12, 44, 4, 36, 14, 46, 6, 38],
+                    [60, 28, 52, 20, 62, 30, 54, 22],
+                    [3, 35, 11, 43, 1, 33, 9, 41],
+                    [51, 19, 59, 27, 49, 17, 57, 25],
+                    [15, 47, 7, 39, 13, 45, 5, 37],
+                    [63, 31, 55, 23, 61, 29, 53, 21]], dtype=np.float32) / 64 - 0.5
+
+def premultiply(colors):
+    """BGRA颜色按alpha预乘，量化误差在预乘空间中计算，全透明像素的颜色不影响结果"""
+    colors = colors.astype(np.float32)
+    colors[:, :3] *= colors[:, 3:] / 255
+    return colors
+
+def nearest_colors(colors, palette):
+    """分批用矩阵乘法求每个颜色最近的调色板下标"""
+    palette_norm = (palette * palette).sum(axis=1)
+    scaled_palette = np.ascontiguousarray(-2 * palette.T)
+    labels = np.empty(len(colors), dtype=np.intp)
+    for start in range(0, len(colors), NEAREST_CHUNK):
+        distances = colors[start:start + NEAREST_CHUNK] @ scaled_palette
+        distances += palette_norm
+        labels[start:start + NEAREST_CHUNK] = np.argmin(distances, axis=1)
+    return labels
+
+def median_cut(colors, weights, count):
+    """加权中位切分，返回各颜色所属盒的下标
+
+    每轮按误差平方和从大到小选出若干颜色盒（不超过剩余可切分数量），沿各自方差最大的通道在加权中位处切开。
+    同一轮的所有盒按 (盒, 通道值) 一起排序、分段累加，256色只需约8轮向量化运算。
+    """
+    colors = colors.astype(np.float64)
+    weights = weights.astype(np.float64)
+    moments = np.column_stack((weights, weights[:, None] * colors, weights[:, None] * colors * colors))
+    labels = np.zeros(len(colors), dtype=np.intp)
+    box_count = 1
+    while box_count < count:
+        totals = np.column_stack([np.bincount(labels, moments[:, column], box_count) for column in range(9)])
+        variances = totals[:, 5:] - totals[:, 1:5] ** 2 / totals[:, :1]
+        errors = variances.sum(axis=1)
+        errors[np.bincount(labels, minlength=box_count) < 2] = 0
+        candidates = np.count_nonzero(errors > 1e-6)
+        if not candidates:
+            break
+        selected = np.zeros(box_count, dtype=bool)
+        selected[np.argsort(-errors, kind='stable')[:min(candidates, count - box_count)]] = True
+
+        # 被选中的盒内颜色按 (盒, 切分通道的值) 排序
+        members = np.flatnonzero(selected[labels])
+        member_labels = labels[members]
+        values = colors[members, np.argmax(variances, axis=1)[member_labels]]
+        order = members[np.lexsort((values, member_labels))]
+        sorted_labels = labels[order]
+        cumulative = np.cumsum(weights[order])
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        before = np.where(starts > 0, cumulative[starts - 1], 0)
+        # 每段中累计权重过半处之后的颜色划入新盒
+        splits = np.clip(np.searchsorted(cumulative, (before + cumulative[ends - 1]) / 2) + 1, starts + 1, ends - 1)
+        segments = np.repeat(np.arange(len(starts)), ends - starts)
+        right = np.arange(len(order)) >= splits[segments]
+        labels[order[right]] = box_count + segments[right]
+        box_count += len(starts)
+    return labels
+
+def color_histogram(keys):
+    """按每通道高5位把BGRA颜色键归入稀疏直方图，返回 (各像素所在格的下标, 各格像素数)
+
+    只对压缩后的20位键排序取出现过的格，查找表也只写入这些格，不需要2^20个计数槽。
+    """
+    reduced = (keys >> 3) & np.uint32(0x1F1F1F1F)
+    packed = (reduced & 0x1F) | ((reduced >> 3) & 0x3E0) | ((reduced >> 6) & 0x7C00) | ((reduced >> 9) & 0xF8000)
+    ordered = np.sort(packed)
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    occupied = ordered[starts]
+    lookup = np.empty(1 << 20, dtype=np.int32)
+    lookup[occupied] = np.arange(len(occupied), dtype=np.int32)
+    return lookup[packed], np.diff(np.r_[starts, len(ordered)])
+
+def bin_colors(keys, bins, counts):
+    """各直方图格内像素的平均颜色，按alpha预乘"""
+    pixels = keys.view(np.uint8).reshape(-1, 4)
+    sums = np.column_stack([np.bincount(bins, pixels[:, channel], len(counts)) for channel in range(4)])
+    return premultiply(sums / counts[:, None])
+
+def cluster_means(labels, colors, count, weights):
+    """按标签逐通道用bincount求颜色的加权均值，返回 (均值, 各标签总权重)"""
+    cluster_weights = np.bincount(labels, weights, count)
+    totals = np.column_stack([np.bincount(labels, colors[:, channel] * weights, count) for channel in range(4)])
+    return totals / np.maximum(cluster_weights, 1e-12)[:, None], cluster_weights
+
+def quantize_palette(image, colors=256, dither=False):
+    """把BGR/BGRA图像量化为不超过colors种颜色，返回 (索引图, RGBA调色板)
+
+    不同颜色数未超过colors时直接使用原颜色（无损）。否则把像素归入每通道5位的稀疏颜色直方图，
+    格数不超过colors时各格的平均颜色即为调色板；格数更多时在预乘alpha空间对各格做加权中位切分和
+    几轮k-means细化。每格映射到离格内平均颜色最近的调色板颜色，像素按所在格查表，
+    不对每个像素单独求最近颜色（格内颜色差不超过每通道8级）。
+    dither=True时叠加8x8 Bayer有序抖动后重新分格再映射到调色板。
+    """
+    height, width = image.shape[:2]
+    if image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    pixels = np.ascontiguousarray(image).reshape(-1, 4)
+    keys = pixels.view('<u4').ravel()
+    # 全透明像素统一为同一种颜色
+    keys = np.where(keys < (1 << 24), np.uint32(0), keys)
+    bins, counts = color_histogram(keys)
+
+    if len(counts) <= colors:
+        # 直方图格数不多时才可能无损，此时再统计精确的颜色数
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        if len(unique_keys) <= colors:
+            palette = unique_keys.view(np.uint8).reshape(-1, 4)[:, [2, 1, 0, 3]]
+            return inverse.reshape(height, width), palette
+
+    means = bin_colors(keys, bins, counts)
+    if len(counts) <= colors:
+        # 格数不超过颜色数时每格各占一种调色板颜色，不需要切分和k-means
+        centers = means.astype(np.float32)
+        labels = np.arange(len(counts))
+    else:
+        weights = counts.astype(np.float64)
+        labels = median_cut(means, weights, colors)
+        for _ in range(PALETTE_KMEANS_ITERATIONS + 1):
+            centers, cluster_weights = cluster_means(labels, means, labels.max() + 1, weights)
+            centers = centers[cluster_weights > 0].astype(np.float32)
+            labels = nearest_colors(means.astype(np.float32), centers)
+
+    if dither:
+        offsets = np.tile(BAYER_8, (height // 8 + 1, width // 8 + 1))[:height, :width].reshape(-1, 1)
+        # 抖动幅度约为相邻调色板颜色的间距
+        spread = 255 / len(centers) ** (1 / 3)
+        dithered = pixels.astype(np.float32)
+        dithered[:, :3] += offsets * spread * (pixels[:, 3:] > 0)
+        dithered = np.clip(np.rint(dithered), 0, 255).astype(np.uint8)
+        keys = np.where(keys == 0, np.uint32(0), dithered.view('<u4').ravel())
+        bins, counts = color_histogram(keys)
+        labels = nearest_colors(bin_colors(keys, bins, counts).astype(np.float32), centers)
+    indices = labels[bins]
+
+    # 反预乘得到调色板颜色
+    alpha = centers[:, 3:]
+    palette = centers.copy()
+    palette[:, :3] = np.where(alpha > 0, centers[:, :3] * 255 / np.maximum(alpha, 1e-6), 0)
+    palette = np.clip(np.rint(palette), 0, 255).astype(np.uint8)[:, [2, 1, 0, 3]]
+    return indices.reshape(height, width), palette
+
+def encode_palette_png(image, colors=256, dither=False, compress_level=6):
+    """量化后写为调色板PNG，半透明颜色排在调色板前部，tRNS只需覆盖这些颜色，返回不复制的memoryview"""
+    indices, palette = quantize_palette(image, colors, dither)
+    order = np.argsort(palette[:, 3] == 255, kind='stable')
+    remap = np.empty(len(order), dtype=np.uint8)
+    remap[order] = np.arange(len(order))
+    palette = palette[order]
+
+    # 灰度图设置调色板后即为P模式，颜色较少时Pillow自动使用1/2/4位深
+    result = Image.fromarray(remap[indices])
+    result.putpalette(palette[:, :3].tobytes())
+    save_params = {'compress_level': compress_level}
+    translucent = int(np.count_nonzero(palette[:, 3] < 255))
+    if translucent:
+        save_params['transparency'] = palette[:translucent, 3].tobytes()
+    buffer = io.BytesIO()
+    result.save(buffer, format='PNG', **save_params)
+    return buffer.getbuffer()
 
 class ImageCompressor:
+    PROXY_SIZE = 512  # 目标大小模式中估计质量用的代理图最长边
+    PROXY_QUALITY_STEP = 10  # 目标大小模式中代理图编码的质量网格间距
+    MAX_SEARCH_ENCODES = 5  # 目标大小模式中全尺寸编码次数上限
+
     def __init__(self):
-        pass
+        # 目标SSIM模式选出的质量: (内容哈希, 格式, 目标SSIM) -> 质量
+        self.quality_cache = {}
+        # 工作进程中单个任务新选出的质量，任务结束后交回主进程合并；为None时不记录
+        self.new_qualities = None
+        # PNG8调色板模式的最大颜色数和是否有序抖动
+        self.palette_colors = 256
+        self.palette_dither = False
 
-    def compress_image(self, image_path, quality=75, output_format="jpg", max_size=None):
-        """压缩图像"""
+    def read_image(self, image_path, max_size=None, keep_alpha=False):
+        """读取图像，JPEG远大于max_size时按2/4/8倍缩小解码，返回 (图像, 原始宽, 原始高)
+
+        keep_alpha=True时保留透明通道，统一为8位BGR或BGRA。
+        """
+        reduce_flag = None
+        has_alpha = True
+        try:
+            # 只读取文件头获取原始尺寸
+            with Image.open(image_path) as header:
+                width, height = header.size
+                has_alpha = header.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') or 'transparency' in header.info
+                is_jpeg = header.format == 'JPEG'
+                if is_jpeg and header.getexif().get(0x0112) in (5, 6, 7, 8):
+                    # EXIF方向为转置或旋转90度时OpenCV解码后会旋转，宽高需要互换
+                    width, height = height, width
+            if max_size and is_jpeg:
+                for factor, flag in REDUCED_DECODE_FLAGS:
+                    # 缩小解码后的尺寸仍不小于max_size，最后再精确缩放
+                    if max(width, height) >= max_size * factor:
+                        reduce_flag = flag
+                        break
+        except Exception:
+            width = height = None
+
+        if reduce_flag is not None:
+            image = cv2.imread(image_path, reduce_flag)
+        elif keep_alpha and has_alpha:
+            # IMREAD_UNCHANGED不应用EXIF方向，只用于确实带透明通道的图像，其余图像和普通读取保持一致
+            image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+            if image is not None:
+                if image.dtype == np.uint16:
+                    image = (image >> 8).astype(np.uint8)
+                if image.ndim == 2:
+                    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        else:
+            image = cv2.imread(image_path)
+        if image is None:
+            return None, None, None
+        if width is None or reduce_flag is None:
+            height, width = image.shape[:2]
+        return image, width, height
+
+    def load_image(self, image_path, max_size=None, keep_alpha=False):
+        """读取图像并按最大尺寸缩小，失败时返回None"""
         # 读取图像
-        image = cv2.imread(image_path)
+        image, width, height = self.read_image(image_path, max_size, keep_alpha)
         if image is None:
-            return None, None
+            return None
         
-        # 如果指定了最大尺寸，调整图像大小
+        # 如果指定了最大尺寸，调整图像大小（目标尺寸按原始尺寸计算）
         if max_size:
-            height, width = image.shape[:2]
             max_dim = max(height, width)
             if max_dim > max_size:
                 scale = max_size / max_dim
                 new_width = int(width * scale)
                 new_height = int(height * scale)
                 image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        
+        return image
+
+    def compress_image(self, image_path, quality=75, output_format="jpg", max_size=None):
+        """压缩图像"""
+        image = self.load_image(image_path, max_size, output_format.lower() == "png8")
+        if image is None:
+            return None, None
+        compressed_data = self.encode_image(image, quality, output_format)
+        if compressed_data is None:
+            return None, None
+        return compressed_data, output_format
+
+    def encode_image(self, image, quality=75, output_format="jpg"):
+        """在内存中编码已解码的图像，失败时返回None
+
+        返回编码器输出缓冲区的memoryview而不是复制出的bytes，写入文件时不再多占一份编码结果的内存。
+        """
+        if output_format.lower() == "png8":
+            # 调色板PNG：质量同普通PNG一样对应压缩级别，颜色数由palette_colors决定
+            try:
+                return encode_palette_png(image, self.palette_colors, self.palette_dither,
+                                          min(9, max(0, int((100 - quality) / 10))))
+            except Exception as e:
+                print(f"调色板PNG编码错误: {str(e)}")
+                return None
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
         # 计算压缩参数
         if output_format.lower() in ["jpg", "jpeg"]:
             encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
@@ -43,27 +367,379 @@ class ImageCompressor:
         success, compressed_image = cv2.imencode(f".{output_format}", image, encode_param)
         
         if not success:
-            return None, None
+            return None
         
-        return compressed_image.tobytes(), output_format
+        return compressed_image.reshape(-1).data
+
+    def predict_log_sizes(self, image, scale, qualities, output_format):
+        """由代理图预测全尺寸图像在各质量下的对数文件大小
+
+        代理图按PROXY_QUALITY_STEP的质量网格编码，其余质量在对数大小上线性插值；
+        2倍边长的代理图在网格中间的质量编码一次，估计文件大小随像素数增长的指数，再外推到全尺寸。
+        """
+        height, width = image.shape[:2]
+
+        def resized(factor):
+            return cv2.resize(image, (max(1, round(width * factor)), max(1, round(height * factor))),
+                              interpolation=cv2.INTER_AREA)
+
+        def log_size(proxy, quality):
+            return np.log(max(1, len(self.encode_image(proxy, int(quality), output_format) or b"")))
+
+        proxy = resized(scale)
+        grid = np.unique(np.r_[qualities[::self.PROXY_QUALITY_STEP], qualities[-1]])
+        grid_sizes = np.array([log_size(proxy, quality) for quality in grid])
+        middle = len(grid) // 2
+        exponent = (log_size(resized(scale * 2), grid[middle]) - grid_sizes[middle]) / np.log(4)
+        return np.interp(qualities, grid, grid_sizes) - 2 * exponent * np.log(scale)
+
+    def compress_to_size(self, image_path, target_bytes, output_format="jpg", max_size=None, tolerance=0.05,
+                         min_quality=5, max_quality=95):
+        """按目标文件大小压缩：只解码一次，在内存中搜索不超过目标大小的最高质量
+
+        先在低分辨率代理图上按粗粒度质量网格编码得到“对数大小-质量”曲线，再用中等分辨率代理图估计
+        文件大小随像素数增长的指数，据此预测全尺寸曲线后才做第一次全尺寸编码。之后每次全尺寸编码都用来
+        校正预测曲线的偏移（两侧结果都有时用两端拟合），落在 [target*(1-tolerance), target] 内即结束。
+        返回 (数据, 格式, 质量)；最低质量仍超出目标时返回最低质量的结果。
+        PNG/PNG8不能按质量控制大小，传入时抛出ValueError。
+        """
+        if output_format.lower() not in LOSSY_FORMATS:
+            raise ValueError(f"目标大小模式不支持 {output_format.upper()} 格式，请使用JPG或WEBP")
+        image = self.load_image(image_path, max_size)
+        if image is None:
+            return None, None, None
+
+        aim = target_bytes * (1 - tolerance / 2)
+        qualities = np.arange(min_quality, max_quality + 1)
+        height, width = image.shape[:2]
+        scale = self.PROXY_SIZE / max(height, width)
+        if scale < 0.5:
+            predicted = self.predict_log_sizes(image, scale, qualities, output_format)
+        else:
+            predicted = None
+
+        def next_quality(low, high, fitted):
+            """预测大小不超过目标的最高质量，限制在 (low, high) 内"""
+            if fitted is None:
+                estimate = (low + high) // 2
+            else:
+                fitting = np.flatnonzero(fitted <= np.log(aim))
+                estimate = qualities[fitting[-1]] if len(fitting) else min_quality
+            return int(min(max(estimate, low + 1), high - 1))
+
+        best = None  # 不超过目标的最高质量 (数据, 质量)
+        over = None  # 超过目标的最低质量 (数据, 质量)
+        quality = next_quality(min_quality - 1, max_quality + 1, predicted)
+        for attempt in range(self.MAX_SEARCH_ENCODES):
+            if attempt == self.MAX_SEARCH_ENCODES - 1 and best is None:
+                # 最后一次仍未找到不超过目标的结果时直接用最低质量，编码次数不超过上限
+                quality = min_quality
+            data = self.encode_image(image, quality, output_format)
+            if data is None:
+                break
+            if len(data) <= target_bytes:
+                if best is None or quality > best[1]:
+                    best = (data, quality)
+                if len(data) >= target_bytes * (1 - tolerance):
+                    break
+            elif over is None or quality < over[1]:
+                over = (data, quality)
 
-    def save_compressed_image(self, compressed_data, output_format, output_dir, base_name):
-        """保存压缩后的图像"""
+            low = best[1] if best else min_quality - 1
+            high = over[1] if over else max_quality + 1
+            if high - low <= 1:
+                break
+            # 用已知的全尺寸结果校正预测曲线：只有一侧结果时整体平移，两侧都有时按两端线性校正；
+            # 没有代理图时两侧结果之间按对数大小线性插值，只有一侧时二分
+            points = [(result[1], np.log(len(result[0]))) for result in (best, over) if result]
+            base = predicted if predicted is not None else np.zeros(len(qualities))
+            offsets = [size - base[point_quality - min_quality] for point_quality, size in points]
+            if len(points) == 2:
+                (q0, _), (q1, _) = points
+                fitted = base + offsets[0] + (offsets[1] - offsets[0]) * (qualities - q0) / (q1 - q0)
+            elif predicted is not None:
+                fitted = predicted + offsets[0]
+            else:
+                fitted = None
+            quality = next_quality(low, high, fitted)
+
+        if best is None:
+            if over is not None and over[1] == min_quality:
+                return over[0], output_format, min_quality
+            return self.encode_image(image, min_quality, output_format), output_format, min_quality
+        return best[0], output_format, best[1]
+
+    def compress_to_ssim(self, image_path, target_ssim, output_format="jpg", max_size=None,
+                         min_quality=5, max_quality=95):
+        """按目标感知质量压缩：查找SSIM不低于target_ssim的最低质量
+
+        解码后的原图亮度平面在各次尝试间复用，选出的质量按像素内容哈希缓存，
+        相同内容再次压缩时只需编码一次。返回 (数据, 格式, 质量, SSIM)，PNG为无损格式，质量为None。
+        """
+        image = self.load_image(image_path, max_size, output_format.lower() == "png8")
+        if image is None:
+            return None, None, None, None
+        if output_format.lower() not in LOSSY_FORMATS:
+            # PNG的质量只对应压缩级别，使用最高压缩级别（质量0对应级别9）
+            return self.encode_image(image, 0, output_format), output_format, None, 1.0
+
+        reference = luminance_plane(image)
+
+        def score(data):
+            decoded = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            candidate = cv2.resize(decoded, (reference.shape[1], reference.shape[0]), interpolation=cv2.INTER_AREA)
+            return compute_ssim(reference, candidate.astype(np.float32))
+
+        digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16)
+        digest.update(np.asarray(image.shape, dtype='<i8').tobytes())
+        cache_key = (digest.hexdigest(), output_format.lower(), round(target_ssim, 4))
+        cached_quality = self.quality_cache.get(cache_key)
+        if cached_quality is not None:
+            data = self.encode_image(image, cached_quality, output_format)
+            if data is not None:
+                return data, output_format, cached_quality, score(data)
+
+        # SSIM随质量单调上升，二分查找满足目标的最低质量
+        best = None
+        low, high = min_quality, max_quality
+        while low <= high:
+            quality = (low + high) // 2
+            data = self.encode_image(image, quality, output_format)
+            if data is None:
+                return None, None, None, None
+            similarity = score(data)
+            if similarity >= target_ssim:
+                best = (data, quality, similarity)
+                high = quality - 1
+            else:
+                low = quality + 1
+
+        if best is None:
+            # 最高质量也达不到目标时使用最高质量
+            data = self.encode_image(image, max_quality, output_format)
+            best = (data, max_quality, score(data))
+        self.quality_cache[cache_key] = best[1]
+        if self.new_qualities is not None:
+            self.new_qualities[cache_key] = best[1]
+        return best[0], output_format, best[1], best[2]
+
+    def save_compressed_image(self, compressed_data, output_format, output_dir, base_name, output_path=None):
+        """保存压缩后的图像：编码缓冲区直接写入临时文件，写完后再原子地换成最终文件名，中断时不会留下半截文件
+
+        指定output_path（上次为同一输入记录的输出）且扩展名一致时原子地覆盖该文件，输出文件名保持不变。
+        """
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         
-        # 生成唯一文件名
-        output_path = os.path.join(output_dir, f"{base_name}_compressed.{output_format}")
-        counter = 1
-        while os.path.exists(output_path):
-            output_path = os.path.join(output_dir, f"{base_name}_compressed_{counter}.{output_format}")
-            counter += 1
-        
-        # 保存文件
-        with open(output_path, "wb") as f:
-            f.write(compressed_data)
-        
-        return output_path
+        extension = FILE_EXTENSIONS.get(output_format, output_format)
+        if output_path and output_path.endswith(f".{extension}"):
+            write_file_atomic(compressed_data, output_path)
+            return output_path
+
+        # 生成唯一文件名，已存在的文件不会被覆盖，多个进程同时保存同名图片时也不会互相覆盖
+        candidates = (os.path.join(output_dir, f"{base_name}_compressed{f'_{counter}' if counter else ''}.{extension}")
+                      for counter in itertools.count())
+        return write_new_file_atomic(compressed_data, candidates)
+
+    def compress_variants(self, image_path, variants, max_size=None):
+        """只解码、缩放一次，用线程并行编码多个 (格式, 质量) 版本（OpenCV编码期间释放GIL）
+
+        返回与variants顺序一致的 [(数据, 格式)]，读取失败时返回None，单个版本编码失败时数据为None。
+        """
+        image = self.load_image(image_path, max_size, any(output_format == "png8" for output_format, _ in variants))
+        if image is None:
+            return None
+        with ThreadPoolExecutor(max_workers=len(variants)) as pool:
+            encoded = list(pool.map(lambda variant: self.encode_image(image, variant[1], variant[0]), variants))
+        return [(data, output_format) for data, (output_format, _) in zip(encoded, variants)]
+
+    def compress_file(self, image_path, output_dir, quality=75, output_format="jpg", max_size=None,
+                      target_bytes=None, target_ssim=None, variants=None, previous_outputs=None):
+        """压缩并保存单张图片，返回输出路径，失败时抛出异常
+
+        指定target_bytes时按目标大小压缩，指定target_ssim时按目标SSIM压缩，否则使用固定质量。
+        指定variants（[(格式, 质量)]）时一次解码输出多个格式，返回输出路径列表。
+        previous_outputs为上次相同参数下记录的输出路径（与variants顺序一致），输出会写回这些路径。
+        """
+        previous_outputs = previous_outputs or []
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        if variants:
+            results = self.compress_variants(image_path, variants, max_size)
+            if results is None:
+                raise ValueError("无法读取图片")
+            failed = [output_format for data, output_format in results if data is None]
+            if failed:
+                raise ValueError(f"无法编码为: {', '.join(failed)}")
+            if len(previous_outputs) != len(results):
+                previous_outputs = [None] * len(results)
+            return [self.save_compressed_image(data, output_format, output_dir, base_name, output_path)
+                    for (data, output_format), output_path in zip(results, previous_outputs)]
+
+        if target_bytes:
+            compressed_data, format_used, _ = self.compress_to_size(image_path, target_bytes, output_format,
+                                                                   max_size)
+        elif target_ssim:
+            compressed_data, format_used, _, _ = self.compress_to_ssim(image_path, target_ssim, output_format,
+                                                                      max_size)
+        else:
+            compressed_data, format_used = self.compress_image(image_path, quality, output_format, max_size)
+        if compressed_data is None:
+            raise ValueError("无法读取或编码图片")
+        return self.save_compressed_image(compressed_data, format_used, output_dir, base_name,
+                                          previous_outputs[0] if len(previous_outputs) == 1 else None)
+
+# 工作进程中的压缩器副本，由进程池初始化函数设置
+_worker_compressor = None
+
+def init_compression_worker(compressor):
+    """进程池初始化：每个工作进程只接收一次压缩器（连同启动时的质量缓存），任务本身不再携带它"""
+    global _worker_compressor
+    _worker_compressor = compressor
+
+def compress_file_job(image_path, output_dir, quality, output_format, max_size, target_bytes=None,
+                      target_ssim=None, variants=None, previous_outputs=None):
+    """进程池任务：用本进程的压缩器压缩单张图片，返回 (输出路径, 本任务新选出的质量缓存项)
+
+    新缓存项交回主进程合并，下次运行启动的工作进程就能用上；本进程的缓存也会保留这些项。
+    """
+    compressor = _worker_compressor
+    compressor.new_qualities = {}
+    try:
+        output_paths = compressor.compress_file(image_path, output_dir, quality, output_format, max_size,
+                                                target_bytes, target_ssim, variants, previous_outputs)
+        return output_paths, compressor.new_qualities
+    finally:
+        compressor.new_qualities = None
+
+class BatchCompressionThread(QThread):
+    """后台批量压缩：多进程并行编码，逐张汇报进度，可取消，失败的文件汇总到错误列表"""
+    progress_updated = pyqtSignal(int, str)  # 已完成数量, 状态信息
+    finished = pyqtSignal(int, int, list)  # 成功数量, 总数量, [(文件路径, 错误信息)]
+    CACHE_CHECKPOINT_INTERVAL = 100  # 每记录这么多张输出把新条目追加到缓存日志，中途中断时已完成的部分仍可跳过
+
+    def __init__(self, compressor, image_paths, output_dir, quality, output_format, max_size, workers=1,
+                 target_bytes=None, target_ssim=None, variants=None, cache=None):
+        super().__init__()
+        self.compressor = compressor
+        self.image_paths = list(image_paths)
+        self.output_dir = output_dir
+        self.quality = quality
+        self.output_format = output_format
+        self.max_size = max_size
+        self.workers = workers
+        self.target_bytes = target_bytes  # 不为空时按目标文件大小压缩
+        self.target_ssim = target_ssim  # 不为空时按目标SSIM压缩
+        self.variants = variants  # 不为空时每张图片输出多个 (格式, 质量) 版本
+        self.cache = cache  # OutputCache，不为空时跳过输入和参数都未变化的图片
+        self.success_count = 0
+        self.skipped_count = 0
+        self.stored_count = 0
+        self.errors = []
+        self.is_running = True
+
+    def job_args(self, image_path):
+        # 输入变化时写回上次记录的输出路径，而不是换一个新文件名
+        previous_outputs = [] if self.cache is None else self.cache.recorded_outputs(image_path, 'compress',
+                                                                                     self.cache_params())
+        return (image_path, self.output_dir, self.quality, self.output_format, self.max_size, self.target_bytes,
+                self.target_ssim, self.variants, previous_outputs)
+
+    def cache_params(self):
+        return {'quality': self.quality, 'format': self.output_format, 'max_size': self.max_size,
+                'target_bytes': self.target_bytes, 'target_ssim': self.target_ssim, 'variants': self.variants,
+                'palette_colors': self.compressor.palette_colors, 'palette_dither': self.compressor.palette_dither}
+
+    def is_cached(self, image_path):
+        """输出已存在且输入和参数都未变化时计为成功并跳过"""
+        if self.cache is None or self.cache.lookup(image_path, 'compress', self.cache_params()) is None:
+            return False
+        self.success_count += 1
+        self.skipped_count += 1
+        return True
+
+    def record_output(self, image_path, output_paths):
+        self.success_count += 1
+        if self.cache is None:
+            return
+        self.cache.store(image_path, 'compress', self.cache_params(), output_paths)
+        self.stored_count += 1
+        if self.stored_count % self.CACHE_CHECKPOINT_INTERVAL == 0:
+            self.cache.checkpoint()
+
+    def run(self):
+        try:
+            if self.workers > 1:
+                self.run_parallel()
+            else:
+                for i, image_path in enumerate(self.image_paths):
+                    if not self.is_running:
+                        break
+                    if self.is_cached(image_path):
+                        self.progress_updated.emit(i + 1, f"未变化，已跳过: {os.path.basename(image_path)}")
+                        continue
+                    try:
+                        self.record_output(image_path, self.compressor.compress_file(*self.job_args(image_path)))
+                    except Exception as e:
+                        self.errors.append((image_path, str(e)))
+                    self.progress_updated.emit(i + 1, f"已处理: {os.path.basename(image_path)}")
+        finally:
+            try:
+                if self.cache is not None:
+                    self.cache.save()
+            finally:
+                # 无论是否出错都要通知界面，否则控件会一直保持禁用状态
+                self.finished.emit(self.success_count, len(self.image_paths), self.errors)
+
+    def run_parallel(self):
+        completed = 0
+        pending = {}
+        queue = deque(self.image_paths)
+        # spawn方式启动子进程，避免在带有Qt线程的进程中fork
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=init_compression_worker,
+                                 initargs=(self.compressor,)) as pool:
+            try:
+                while True:
+                    # 只保持少量排队任务，取消时无需等待整批完成
+                    while self.is_running and queue and len(pending) < 2 * self.workers:
+                        image_path = queue.popleft()
+                        if self.is_cached(image_path):
+                            completed += 1
+                            self.progress_updated.emit(completed, f"未变化，已跳过: {os.path.basename(image_path)}")
+                            continue
+                        try:
+                            future = pool.submit(compress_file_job, *self.job_args(image_path))
+                        except Exception:
+                            queue.appendleft(image_path)
+                            raise
+                        pending[future] = image_path
+                    if not self.is_running:
+                        # 取消尚未开始的任务，只等待正在编码的图片
+                        for future in [future for future in pending if future.cancel()]:
+                            del pending[future]
+                    if not pending:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        image_path = pending.pop(future)
+                        completed += 1
+                        try:
+                            output_paths, quality_cache = future.result()
+                            self.compressor.quality_cache.update(quality_cache)
+                            self.record_output(image_path, output_paths)
+                        except Exception as e:
+                            self.errors.append((image_path, str(e)))
+                        self.progress_updated.emit(completed, f"已处理: {os.path.basename(image_path)}")
+            except Exception as e:
+                # 工作进程异常退出（如被系统OOM终止）后进程池不可再用，正在处理和尚未开始的图片都记为失败
+                failed = list(pending.values()) + (list(queue) if self.is_running else [])
+                self.errors.extend((image_path, f"工作进程异常退出: {e}") for image_path in failed)
+                if failed:
+                    self.progress_updated.emit(completed + len(failed), f"工作进程异常退出，{len(failed)} 张图片未处理")
+
+    def stop(self):
+        self.is_running = False
 
 class ImageCompressionController(QMainWindow):
     def __init__(self):
@@ -73,6 +749,7 @@ class ImageCompressionController(QMainWindow):
         self.compressor = ImageCompressor()
         self.image_paths = []
         self.output_dir = ""
+        self.compression_thread = None
         self.init_ui()
 
     def init_ui(self):
@@ -89,11 +766,15 @@ class ImageCompressionController(QMainWindow):
         self.output_button.clicked.connect(self.select_output_dir)
         self.process_button = QPushButton("开始压缩")
         self.process_button.clicked.connect(self.process_images)
+        self.stop_button = QPushButton("停止")
+        self.stop_button.clicked.connect(self.stop_processing)
+        self.stop_button.setEnabled(False)
         
         button_layout.addWidget(self.add_button)
         button_layout.addWidget(self.clear_button)
         button_layout.addWidget(self.output_button)
         button_layout.addWidget(self.process_button)
+        button_layout.addWidget(self.stop_button)
         main_layout.addLayout(button_layout)
 
         # 参数设置
@@ -118,11 +799,62 @@ class ImageCompressionController(QMainWindow):
         
         param_layout.addWidget(QLabel("格式:"))
         self.format_combo = QComboBox()
-        self.format_combo.addItems(["JPG", "PNG", "WEBP"])
+        self.format_combo.addItems(["JPG", "PNG", "PNG8", "WEBP"])
+        self.format_combo.setItemData(2, "调色板PNG：量化为不超过指定数量的颜色，保留透明度", Qt.ToolTipRole)
         param_layout.addWidget(self.format_combo)
-        
+
         main_layout.addLayout(param_layout)
 
+        # 压缩模式：固定质量 / 目标大小 / 目标SSIM
+        mode_layout = QHBoxLayout()
+        mode_layout.addWidget(QLabel("压缩模式:"))
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(["固定质量", "目标大小", "目标SSIM"])
+        mode_layout.addWidget(self.mode_combo)
+        mode_layout.addWidget(QLabel("目标大小:"))
+        self.target_size_spin = QSpinBox()
+        self.target_size_spin.setRange(1, 100000)
+        self.target_size_spin.setValue(150)
+        self.target_size_spin.setSuffix(" KB")
+        mode_layout.addWidget(self.target_size_spin)
+        mode_layout.addWidget(QLabel("目标SSIM:"))
+        self.target_ssim_spin = QDoubleSpinBox()
+        self.target_ssim_spin.setRange(0.5, 0.999)
+        self.target_ssim_spin.setDecimals(3)
+        self.target_ssim_spin.setSingleStep(0.005)
+        self.target_ssim_spin.setValue(0.95)
+        mode_layout.addWidget(self.target_ssim_spin)
+
+        mode_layout.addWidget(QLabel("并行进程:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(os.cpu_count() or 1)
+        mode_layout.addWidget(self.workers_spin)
+        self.skip_unchanged_check = QCheckBox("跳过未变化的图片")
+        self.skip_unchanged_check.setToolTip("输出目录中已有相同参数的压缩结果且原图未修改时不再重复压缩")
+        mode_layout.addWidget(self.skip_unchanged_check)
+        mode_layout.addStretch()
+        
+        main_layout.addLayout(mode_layout)
+
+        # 多格式输出：一次解码同时编码多个格式
+        variants_layout = QHBoxLayout()
+        self.variants_check = QCheckBox("多格式输出:")
+        variants_layout.addWidget(self.variants_check)
+        self.variants_edit = QLineEdit("jpg:80, webp:75, png")
+        self.variants_edit.setToolTip("格式:质量，用逗号分隔；未写质量时使用质量滑块的值")
+        variants_layout.addWidget(self.variants_edit)
+
+        # PNG8调色板设置
+        variants_layout.addWidget(QLabel("PNG8颜色数:"))
+        self.palette_colors_spin = QSpinBox()
+        self.palette_colors_spin.setRange(2, 256)
+        self.palette_colors_spin.setValue(256)
+        variants_layout.addWidget(self.palette_colors_spin)
+        self.palette_dither_check = QCheckBox("有序抖动")
+        variants_layout.addWidget(self.palette_dither_check)
+        main_layout.addLayout(variants_layout)
+
         # 图片列表和预览
         content_layout = QHBoxLayout()
         self.image_list = QListWidget()
@@ -137,6 +869,13 @@ class ImageCompressionController(QMainWindow):
 
         main_layout.addLayout(content_layout)
 
+        # 进度
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        main_layout.addWidget(self.progress_bar)
+        self.status_label = QLabel("准备就绪")
+        main_layout.addWidget(self.status_label)
+
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)
 
@@ -192,22 +931,84 @@ class ImageCompressionController(QMainWindow):
         quality = self.quality_slider.value()
         max_size = self.size_slider.value()
         output_format = self.format_combo.currentText().lower()
-        
-        for path in self.image_paths:
-            base_name = os.path.splitext(os.path.basename(path))[0]
-            compressed_data, format_used = self.compressor.compress_image(
-                path, quality, output_format, max_size
-            )
-            
-            if compressed_data is None:
-                QMessageBox.warning(self, "错误", f"无法压缩图片: {os.path.basename(path)}")
-                continue
-                
-            output_path = self.compressor.save_compressed_image(
-                compressed_data, format_used, self.output_dir, base_name
-            )
-            
-        QMessageBox.information(self, "完成", f"已压缩 {len(self.image_paths)} 张图片")
+        # 目标大小/目标SSIM模式下忽略质量滑块，由压缩器搜索质量
+        mode = self.mode_combo.currentText()
+        target_bytes = self.target_size_spin.value() * 1024 if mode == "目标大小" else None
+        target_ssim = self.target_ssim_spin.value() if mode == "目标SSIM" else None
+        variants = None
+        if self.variants_check.isChecked():
+            # 多格式输出使用各自的固定质量
+            try:
+                variants = parse_variants(self.variants_edit.text(), quality)
+            except ValueError as e:
+                QMessageBox.warning(self, "警告", f"多格式输出设置有误: {str(e)}")
+                return
+        elif target_bytes and output_format not in LOSSY_FORMATS:
+            # PNG/PNG8没有可调的质量参数，无法保证输出不超过目标大小
+            QMessageBox.warning(self, "警告", "目标大小模式只支持JPG和WEBP格式")
+            return
+
+        self.compressor.palette_colors = self.palette_colors_spin.value()
+        self.compressor.palette_dither = self.palette_dither_check.isChecked()
+
+        self.set_controls_enabled(False)
+        self.progress_bar.setMaximum(len(self.image_paths))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+
+        self.compression_thread = BatchCompressionThread(
+            self.compressor, self.image_paths, self.output_dir, quality, output_format, max_size,
+            self.workers_spin.value(), target_bytes, target_ssim, variants,
+            OutputCache(self.output_dir) if self.skip_unchanged_check.isChecked() else None
+        )
+        self.compression_thread.progress_updated.connect(self.update_progress)
+        self.compression_thread.finished.connect(self.on_compression_finished)
+        self.compression_thread.start()
+
+    def stop_processing(self):
+        if self.compression_thread and self.compression_thread.isRunning():
+            self.compression_thread.stop()
+            self.stop_button.setEnabled(False)
+            self.status_label.setText("正在停止，等待进行中的图片完成...")
+
+    def update_progress(self, value, message):
+        self.progress_bar.setValue(value)
+        self.status_label.setText(message)
+
+    def on_compression_finished(self, success_count, total_count, errors):
+        self.progress_bar.setVisible(False)
+        self.set_controls_enabled(True)
+        self.status_label.setText(f"压缩完成: {success_count}/{total_count} 成功")
+
+        # 所有失败的文件汇总在一个对话框中
+        message_box = QMessageBox(self)
+        message_box.setWindowTitle("完成")
+        summary = f"已压缩 {success_count}/{total_count} 张图片"
+        cache = self.compression_thread.cache
+        if cache is not None:
+            summary += f"，其中 {self.compression_thread.skipped_count} 张未变化已跳过（缓存命中率 {cache.hit_rate():.0%}）"
+        message_box.setText(summary)
+        if errors:
+            message_box.setIcon(QMessageBox.Warning)
+            message_box.setInformativeText(f"{len(errors)} 张图片压缩失败，详情见下方列表")
+            message_box.setDetailedText("\n".join(f"{os.path.basename(path)}: {error}" for path, error in errors))
+        else:
+            message_box.setIcon(QMessageBox.Information)
+        message_box.exec_()
+
+    def set_controls_enabled(self, enabled):
+        self.add_button.setEnabled(enabled)
+        self.clear_button.setEnabled(enabled)
+        self.output_button.setEnabled(enabled)
+        self.process_button.setEnabled(enabled)
+        self.stop_button.setEnabled(not enabled)
+
+    def closeEvent(self, event):
+        # 确保在关闭窗口时停止线程
+        if self.compression_thread and self.compression_thread.isRunning():
+            self.compression_thread.stop()
+            self.compression_thread.wait()
+        event.accept()
 
 if __name__ == "__main__":
     import sys
@@ -12,116 +12,442 @@ import subprocess
 import sys
 import shutil
 from datetime import datetime
-from collections import defaultdict
+from array import array
+import csv
+import json
+
+# JPEG标准亮度量化表 (IJG, 质量50)
+STANDARD_LUMINANCE_QUANT_TABLE = [
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+]
+
+# 各颜色模式的位深
+MODE_BIT_DEPTHS = {
+    '1': 1, 'L': 8, 'P': 8, 'LA': 16, 'PA': 16, 'RGB': 24, 'YCbCr': 24, 'LAB': 24, 'HSV': 24,
+    'RGBA': 32, 'RGBX': 32, 'CMYK': 32, 'I;16': 16, 'I;16B': 16, 'I;16L': 16, 'I': 32, 'F': 32,
+}
+
+# 每个字节中置位数量的查找表
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount64(values):
+    """逐元素统计uint64数组中的置位数量"""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint16)
+
+# 可选的哈希边长，对应 64 / 144 / 256 位哈希
+HASH_SIZES = [8, 12, 16]
+
+def supported_hash_sizes(hash_method):
+    """哈希方法可用的哈希边长；whash基于Haar小波分解，边长必须是2的幂"""
+    if hash_method == 'whash':
+        return [size for size in HASH_SIZES if size & (size - 1) == 0]
+    return HASH_SIZES
+
+def check_hash_size(hash_method, hash_size):
+    """哈希方法不支持该边长时抛出ValueError，在开始处理前报错，而不是逐张图片失败后被跳过"""
+    if hash_method == 'whash' and hash_size & (hash_size - 1):
+        raise ValueError(f"whash的哈希尺寸必须是2的幂，不支持 {hash_size}×{hash_size}")
+
+def hash_word_count(hash_size):
+    """哈希边长对应的uint64字数"""
+    return (hash_size * hash_size + 63) // 64
+
+def pack_hash(hash_value, words):
+    """把ImageHash的位矩阵打包为uint64数组"""
+    packed = np.packbits(np.asarray(hash_value.hash, dtype=np.bool_).ravel())
+    buffer = np.zeros(words * 8, dtype=np.uint8)
+    buffer[:packed.size] = packed
+    return buffer.view(np.uint64)
+
+class PathTable:
+    """紧凑路径表：目录字符串驻留，文件名连续存放在一个字节缓冲区中"""
+
+    def __init__(self, paths=()):
+        self.directories = []
+        self._directory_ids = {}
+        self._directory_column = array('i')
+        self._names = bytearray()
+        self._offsets = array('q', [0])
+        for path in paths:
+            self.append(path)
+
+    def append(self, path):
+        """追加路径，返回行号"""
+        split = max(path.rfind('/'), path.rfind(os.sep)) + 1
+        directory, name = path[:split], path[split:]
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = len(self.directories)
+            self._directory_ids[directory] = directory_id
+            self.directories.append(directory)
+        self._directory_column.append(directory_id)
+        self._names += name.encode('utf-8', 'surrogateescape')
+        self._offsets.append(len(self._names))
+        return len(self._directory_column) - 1
+
+    def copy(self):
+        """复制路径表，之后对原表的追加不影响副本"""
+        table = PathTable()
+        table.directories = list(self.directories)
+        table._directory_ids = dict(self._directory_ids)
+        table._directory_column = array('i', self._directory_column)
+        table._names = bytearray(self._names)
+        table._offsets = array('q', self._offsets)
+        return table
+
+    def basename(self, row):
+        return self._names[self._offsets[row]:self._offsets[row + 1]].decode('utf-8', 'surrogateescape')
+
+    def __getitem__(self, row):
+        return self.directories[self._directory_column[row]] + self.basename(row)
+
+    def __len__(self):
+        return len(self._directory_column)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def nbytes(self):
+        """路径表占用的字节数（不含驻留的目录字符串）"""
+        return (self._directory_column.itemsize * len(self._directory_column) + len(self._names)
+                + self._offsets.itemsize * len(self._offsets))
+
+class DeduplicationIndex:
+    """列式查重状态，所有分组、导出和界面代码都基于行号访问"""
+
+    def __init__(self, paths, hash_words=1):
+        # 传入的路径表归索引所有，之后不应再追加（界面传入的是副本），否则行数与各列长度不一致
+        self.paths = paths if isinstance(paths, PathTable) else PathTable(paths)
+        count = len(self.paths)
+        self.valid = np.zeros(count, dtype=np.bool_)
+        self.hashes = np.zeros((count, hash_words), dtype=np.uint64)  # 多字打包哈希
+        self.group_ids = np.full(count, -1, dtype=np.int32)
+        self.distances = np.zeros(count, dtype=np.uint16)  # 到组代表的汉明距离或SIFT匹配数
+        self.widths = np.zeros(count, dtype=np.int32)
+        self.heights = np.zeros(count, dtype=np.int32)
+        self.bit_depths = np.zeros(count, dtype=np.uint8)
+        self.jpeg_qualities = np.zeros(count, dtype=np.uint8)
+        self.sharpness = np.zeros(count, dtype=np.float32)
+        self.file_sizes = np.zeros(count, dtype=np.int64)
+        self.mtimes = np.zeros(count, dtype=np.float64)
+        self.group_count = 0
+        self.distance_kind = 'hamming'
+
+    def __len__(self):
+        return len(self.paths)
+
+    def set_features(self, row, features):
+        """写入一行质量特征"""
+        self.widths[row] = features['width']
+        self.heights[row] = features['height']
+        self.bit_depths[row] = min(255, features['bit_depth'])
+        self.jpeg_qualities[row] = features['jpeg_quality']
+        self.sharpness[row] = features['sharpness']
+        self.file_sizes[row] = features['file_size']
+        self.mtimes[row] = features['mtime']
+
+    def assign_groups(self, cluster_ids):
+        """根据聚类编号生成组编号，只保留多于一个成员的组，并按首次出现顺序编号"""
+        valid_rows = np.flatnonzero(cluster_ids >= 0)
+        clusters = cluster_ids[valid_rows]
+        sizes = np.bincount(clusters) if clusters.size else np.zeros(0, dtype=np.int64)
+        # 按各聚类首个成员的行号排序，保证组编号稳定
+        first_rows = np.full(sizes.size, len(self), dtype=np.int64)
+        np.minimum.at(first_rows, clusters, valid_rows)
+        duplicate_clusters = np.flatnonzero(sizes > 1)
+        duplicate_clusters = duplicate_clusters[np.argsort(first_rows[duplicate_clusters], kind='stable')]
+        mapping = np.full(sizes.size, -1, dtype=np.int32)
+        mapping[duplicate_clusters] = np.arange(duplicate_clusters.size, dtype=np.int32)
+        self.group_ids.fill(-1)
+        self.group_ids[valid_rows] = mapping[clusters]
+        self.group_count = int(duplicate_clusters.size)
+
+    def iter_groups(self):
+        """按组编号依次产出 (组编号, 行号数组)，组内保持原始顺序"""
+        grouped_rows = np.flatnonzero(self.group_ids >= 0)
+        if grouped_rows.size == 0:
+            return
+        grouped_rows = grouped_rows[np.argsort(self.group_ids[grouped_rows], kind='stable')]
+        group_ids = self.group_ids[grouped_rows]
+        boundaries = np.flatnonzero(np.diff(group_ids)) + 1
+        for rows in np.split(grouped_rows, boundaries):
+            yield int(self.group_ids[rows[0]]), rows
+
+    def nbytes(self):
+        """列式状态占用的字节数"""
+        columns = (self.valid, self.hashes, self.group_ids, self.distances, self.widths, self.heights,
+                   self.bit_depths, self.jpeg_qualities, self.sharpness, self.file_sizes, self.mtimes)
+        return self.paths.nbytes() + sum(column.nbytes for column in columns)
 
 class ImageDeduplicator:
+    # 哈希和质量评估共用的小尺寸解码边长
+    THUMBNAIL_SIZE = 256
+
     def __init__(self):
         pass
 
-    def compute_hash(self, image_path, hash_method='phash'):
-        """计算图像的哈希值"""
+    @staticmethod
+    def estimate_jpeg_quality(image):
+        """根据亮度量化表估算JPEG质量，非JPEG图像返回100"""
+        quantization = getattr(image, 'quantization', None)
+        if not quantization or 0 not in quantization:
+            return 100
+        # 与标准表的平均比例即IJG缩放因子，与量化表的存储顺序无关
+        scale = 100.0 * sum(quantization[0]) / sum(STANDARD_LUMINANCE_QUANT_TABLE)
+        if scale <= 100:
+            quality = (200 - scale) / 2
+        else:
+            quality = 5000 / scale
+        return int(min(100, max(1, round(quality))))
+
+    def measure_quality(self, image_path, image, small_gray, size=None, mode=None):
+        """从图像头信息和小尺寸灰度解码中提取质量特征"""
+        width, height = size or image.size
+        mode = mode or image.mode
         try:
-            image = Image.open(image_path)
+            stat = os.stat(image_path)
+            file_size, mtime = stat.st_size, stat.st_mtime
+        except OSError:
+            file_size, mtime = 0, 0
+        # 拉普拉斯方差作为清晰度评分
+        sharpness = float(cv2.Laplacian(np.asarray(small_gray, dtype=np.uint8), cv2.CV_64F).var())
+        return {
+            'width': width,
+            'height': height,
+            'bit_depth': MODE_BIT_DEPTHS.get(mode, 8 * Image.getmodebands(mode)),
+            'sharpness': sharpness,
+            'jpeg_quality': self.estimate_jpeg_quality(image),
+            'file_size': file_size,
+            'mtime': mtime,
+        }
+
+    def load_small_image(self, image_path):
+        """读取小尺寸灰度图，返回 (灰度图, 质量特征)"""
+        with Image.open(image_path) as image:
+            # draft会修改尺寸和模式，需先记录原始头信息
+            size, mode = image.size, image.mode
+            # JPEG可在解码时直接按DCT缩放，避免完整解码
+            image.draft('L', (self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE))
+            small_gray = image.convert('L')
+            small_gray.thumbnail((self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE))
+            features = self.measure_quality(image_path, image, small_gray, size, mode)
+        return small_gray, features
+
+    def analyze_image(self, image_path, hash_method='phash', hash_size=8):
+        """计算图像哈希并提取质量特征，返回 (哈希, 质量特征)；哈希方法与边长不匹配时抛出ValueError"""
+        check_hash_size(hash_method, hash_size)
+        try:
+            small_gray, features = self.load_small_image(image_path)
             if hash_method == 'ahash':
-                hash_value = imagehash.average_hash(image)
+                hash_value = imagehash.average_hash(small_gray, hash_size=hash_size)
             elif hash_method == 'phash':
-                hash_value = imagehash.phash(image)
+                hash_value = imagehash.phash(small_gray, hash_size=hash_size)
             elif hash_method == 'dhash':
-                hash_value = imagehash.dhash(image)
+                hash_value = imagehash.dhash(small_gray, hash_size=hash_size)
             elif hash_method == 'whash':
-                hash_value = imagehash.whash(image)
+                hash_value = imagehash.whash(small_gray, hash_size=hash_size)
             else:
                 raise ValueError("不支持的哈希方法")
-            return str(hash_value)
+            return hash_value, features
         except Exception as e:
             print(f"处理图片错误 {image_path}: {e}")
-            return None
+            return None, None
 
-    def find_duplicate_groups(self, image_paths, hash_method='phash', threshold=5):
-        """查找重复图片组"""
-        hash_groups = defaultdict(list)
-        
-        for path in image_paths:
-            img_hash = self.compute_hash(path, hash_method)
-            if img_hash is None:
+    def compute_hash(self, image_path, hash_method='phash', hash_size=8):
+        """计算图像的哈希值"""
+        hash_value, _ = self.analyze_image(image_path, hash_method, hash_size)
+        return str(hash_value) if hash_value is not None else None
+
+    def write_report(self, index, output_path, report_format='csv', kept_mask=None):
+        """逐组流式导出重复报告；kept_mask为空时按质量排序保留每组最佳文件"""
+        with DuplicateReportWriter(output_path, report_format) as writer:
+            for group_id, rows in index.iter_groups():
+                if kept_mask is not None:
+                    kept_rows = rows[kept_mask[rows]]
+                else:
+                    kept_rows = rows[self.rank_group(index, rows)[:1]]
+                writer.write_group(index, group_id, rows, kept_rows)
+        return writer.record_count
+
+    def rank_group(self, index, rows):
+        """按质量对组内文件排序，返回从优到劣的组内下标"""
+        pixels = index.widths[rows].astype(np.float64) * index.heights[rows]
+        # 优先级: 分辨率 > 位深 > JPEG质量 > 清晰度 > 文件大小 > 修改时间
+        order = np.lexsort((-index.mtimes[rows], -index.file_sizes[rows].astype(np.float64),
+                            -index.sharpness[rows], -index.jpeg_qualities[rows].astype(np.int16),
+                            -index.bit_depths[rows].astype(np.int16), -pixels))
+        return order.tolist()
+
+    def find_duplicate_groups(self, image_paths, hash_method='phash', threshold=5, group_callback=None,
+                              hash_size=8):
+        """查找重复图片组，返回列式查重索引；group_callback(索引, 组编号, 行号数组) 在每组确定后调用"""
+        check_hash_size(hash_method, hash_size)
+        words = hash_word_count(hash_size)
+        index = DeduplicationIndex(image_paths, hash_words=words)
+        index.distance_kind = 'hamming'
+
+        for row, path in enumerate(index.paths):
+            hash_value, features = self.analyze_image(path, hash_method, hash_size)
+            if hash_value is None:
                 continue
-                
-            # 检查是否与现有组匹配
-            matched = False
-            for existing_hash in list(hash_groups.keys()):
-                hamming_distance = bin(int(img_hash, 16) ^ int(existing_hash, 16)).count("1")
-                if hamming_distance <= threshold:
-                    hash_groups[existing_hash].append(path)
-                    matched = True
-                    break
-            
-            if not matched:
-                hash_groups[img_hash].append(path)
-        
-        # 只返回包含重复的组
-        duplicate_groups = [group for group in hash_groups.values() if len(group) > 1]
-        return duplicate_groups
-
-    def find_duplicate_groups_by_sift(self, image_paths, ratio=0.7, min_matches=10):
-        """使用SIFT特征匹配查找重复图片组"""
-        # 实现SIFT分组逻辑
-        # 由于SIFT实现较为复杂，这里简化处理，实际实现需要更复杂的逻辑
-        duplicates = []
+            index.hashes[row] = pack_hash(hash_value, words)
+            index.set_features(row, features)
+            index.valid[row] = True
+
+        self.group_by_hash(index, threshold)
+        if group_callback is not None:
+            # 贪心分组在全部哈希完成后才确定，此时逐组回调
+            for group_id, rows in index.iter_groups():
+                group_callback(index, group_id, rows)
+        return index
+
+    def group_by_hash(self, index, threshold):
+        """按汉明距离把哈希贪心归入已有组（与各组首个哈希比较）"""
+        cluster_ids = np.full(len(index), -1, dtype=np.int64)
+        representatives = np.empty_like(index.hashes)
+        cluster_count = 0
+
+        for row in np.flatnonzero(index.valid):
+            img_hash = index.hashes[row]
+            # 检查是否与现有组匹配（逐字异或后累加各字的置位数）
+            if cluster_count:
+                distances = popcount64(representatives[:cluster_count] ^ img_hash).sum(axis=1, dtype=np.int64)
+                matched = np.flatnonzero(distances <= threshold)
+                if matched.size:
+                    cluster_ids[row] = matched[0]
+                    index.distances[row] = distances[matched[0]]
+                    continue
+
+            representatives[cluster_count] = img_hash
+            cluster_ids[row] = cluster_count
+            index.distances[row] = 0
+            cluster_count += 1
+
+        # 只保留包含重复的组
+        index.assign_groups(cluster_ids)
+        return index
+
+    def find_duplicate_groups_by_sift(self, image_paths, ratio=0.7, min_matches=10, group_callback=None):
+        """使用SIFT特征匹配查找重复图片组，返回列式查重索引；group_callback(索引, 组编号, 行号数组) 在每组确定后调用"""
+        index = DeduplicationIndex(image_paths)
+        index.distance_kind = 'matches'
         sift = cv2.SIFT_create()
         matcher = cv2.BFMatcher()
 
-        features = {}
-        for path in image_paths:
+        features = {}  # 行号 -> 描述子
+        for row, path in enumerate(index.paths):
             try:
-                pil_image = Image.open(path).convert('L')
-                img = np.array(pil_image)
-                
-                if img.dtype != np.uint8:
-                    img = img.astype(np.uint8)
-                    
+                with Image.open(path) as image:
+                    img = np.array(image.convert('L'))
+
+                    if img.dtype != np.uint8:
+                        img = img.astype(np.uint8)
+
+                    # 复用SIFT的灰度解码生成小图，用于质量评估
+                    scale = min(1.0, self.THUMBNAIL_SIZE / max(img.shape))
+                    small_gray = cv2.resize(img, (max(1, int(img.shape[1] * scale)), max(1, int(img.shape[0] * scale))),
+                                            interpolation=cv2.INTER_AREA)
+                    index.set_features(row, self.measure_quality(path, image, small_gray))
+
                 kp, des = sift.detectAndCompute(img, None)
                 if des is not None:
-                    features[path] = des
+                    features[row] = des
+                    index.valid[row] = True
             except Exception as e:
                 print(f"处理图片错误 {path}: {e}")
                 continue
 
-        # 简化的分组实现 - 实际应使用更复杂的分组算法
-        processed = set()
-        groups = []
-        paths = list(features.keys())
-        
-        for i, path1 in enumerate(paths):
-            if path1 in processed:
+        # 简化的分组实现 - 每组以首个成员为代表
+        cluster_ids = np.full(len(index), -1, dtype=np.int64)
+        rows = list(features.keys())
+        finalized_groups = 0
+
+        for i, row1 in enumerate(rows):
+            if cluster_ids[row1] >= 0:
                 continue
-                
-            group = [path1]
-            des1 = features[path1]
-            
-            for j, path2 in enumerate(paths[i+1:], i+1):
-                if path2 in processed:
+
+            cluster_ids[row1] = row1
+            index.distances[row1] = 0
+            des1 = features[row1]
+            group_rows = [row1]
+
+            for row2 in rows[i+1:]:
+                if cluster_ids[row2] >= 0:
                     continue
-                    
-                des2 = features[path2]
+
+                des2 = features[row2]
                 try:
                     matches = matcher.knnMatch(des1, des2, k=2)
-                    good_matches = []
-                    for m, n in matches:
-                        if m.distance < ratio * n.distance:
-                            good_matches.append(m)
-
-                    if len(good_matches) >= min_matches:
-                        group.append(path2)
-                        processed.add(path2)
+                    good_matches = 0
+                    for pair in matches:
+                        if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance:
+                            good_matches += 1
+
+                    if good_matches >= min_matches:
+                        cluster_ids[row2] = row1
+                        index.distances[row2] = min(good_matches, np.iinfo(np.uint16).max)
+                        group_rows.append(row2)
                 except Exception as e:
-                    print(f"匹配错误 {path1} 和 {path2}: {e}")
+                    print(f"匹配错误 {index.paths[row1]} 和 {index.paths[row2]}: {e}")
                     continue
-            
-            if len(group) > 1:
-                groups.append(group)
-                processed.add(path1)
-        
-        return groups
+
+            # 组按首个成员的顺序确定，编号与assign_groups一致
+            if len(group_rows) > 1:
+                if group_callback is not None:
+                    group_callback(index, finalized_groups, np.array(group_rows, dtype=np.int64))
+                finalized_groups += 1
+
+        index.assign_groups(cluster_ids)
+        return index
+
+class DuplicateReportWriter:
+    """流式重复报告写入器，每个组成员输出一条记录 (CSV / JSON Lines)"""
+    FIELDS = ['group_id', 'path', 'kept', 'distance', 'distance_kind', 'width', 'height', 'file_size']
+    FORMATS = {'CSV': 'csv', 'JSON Lines': 'jsonl'}
+
+    def __init__(self, output_path, report_format='csv'):
+        if report_format not in ('csv', 'jsonl'):
+            raise ValueError("不支持的报告格式")
+        self.output_path = output_path
+        self.report_format = report_format
+        self.record_count = 0
+        self._file = open(output_path, "w", encoding='utf-8', newline='')
+        self._csv_writer = None
+        if report_format == 'csv':
+            self._csv_writer = csv.writer(self._file)
+            self._csv_writer.writerow(self.FIELDS)
+
+    def write_group(self, index, group_id, rows, kept_rows=()):
+        """写入一个已完成的组，kept_rows为该组中保留的行号"""
+        kept_rows = set(int(row) for row in kept_rows)
+        for row in rows:
+            row = int(row)
+            record = [group_id + 1, index.paths[row], row in kept_rows, int(index.distances[row]),
+                      index.distance_kind, int(index.widths[row]), int(index.heights[row]),
+                      int(index.file_sizes[row])]
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(record)
+            else:
+                self._file.write(json.dumps(dict(zip(self.FIELDS, record)), ensure_ascii=False))
+                self._file.write("\n")
+            self.record_count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 class BatchFileCleaner:
     """批处理文件清理工具"""
@@ -212,36 +538,74 @@ class BatchFileCleaner:
 class DeduplicationThread(QThread):
     """后台查重线程"""
     progress_signal = pyqtSignal(int)
-    result_signal = pyqtSignal(list)
+    result_signal = pyqtSignal(object)
     log_signal = pyqtSignal(str)
     
-    def __init__(self, deduplicator, image_paths, method, threshold):
+    def __init__(self, deduplicator, image_paths, method, threshold, hash_size=8, report_path=None,
+                 report_format='csv'):
         super().__init__()
         self.deduplicator = deduplicator
         self.image_paths = image_paths
         self.method = method
         self.threshold = threshold
-        self.duplicate_groups = []
+        self.hash_size = hash_size
+        self.report_path = report_path  # 不为空时在每组确定后立即写出报告记录
+        self.report_format = report_format
+        self.dedup_index = None
+
+    def write_group(self, index, group_id, rows):
+        """分组回调：按质量排序保留每组最佳文件，逐组写出报告"""
+        kept_rows = rows[self.deduplicator.rank_group(index, rows)[:1]]
+        self.report_writer.write_group(index, group_id, rows, kept_rows)
     
     def run(self):
+        self.report_writer = None
         try:
             self.log_signal.emit("开始查重处理...")
-            total = len(self.image_paths)
+            group_callback = None
+            if self.report_path:
+                self.report_writer = DuplicateReportWriter(self.report_path, self.report_format)
+                group_callback = self.write_group
             
             if self.method == "感知哈希":
-                self.duplicate_groups = self.deduplicator.find_duplicate_groups(
-                    self.image_paths, 'phash', self.threshold)
+                self.dedup_index = self.deduplicator.find_duplicate_groups(
+                    self.image_paths, 'phash', self.threshold, group_callback, hash_size=self.hash_size)
             else:
-                self.duplicate_groups = self.deduplicator.find_duplicate_groups_by_sift(
-                    self.image_paths, ratio=0.7, min_matches=self.threshold)
+                self.dedup_index = self.deduplicator.find_duplicate_groups_by_sift(
+                    self.image_paths, ratio=0.7, min_matches=self.threshold, group_callback=group_callback)
             
+            if self.report_writer is not None:
+                self.report_writer.close()
+                self.log_signal.emit(f"已流式写出 {self.report_writer.record_count} 条重复记录: {self.report_path}")
             self.progress_signal.emit(100)
-            self.result_signal.emit(self.duplicate_groups)
-            self.log_signal.emit(f"查重完成，找到 {len(self.duplicate_groups)} 组重复图片")
+            self.result_signal.emit(self.dedup_index)
+            self.log_signal.emit(f"查重完成，找到 {self.dedup_index.group_count} 组重复图片")
             
         except Exception as e:
             self.log_signal.emit(f"查重过程出错: {e}")
-            self.result_signal.emit([])
+            self.result_signal.emit(None)
+        finally:
+            if self.report_writer is not None:
+                self.report_writer.close()
+
+class QualityRankingThread(QThread):
+    """后台质量排序线程，为每个重复组选出最佳保留文件"""
+    ranking_signal = pyqtSignal(list)
+
+    def __init__(self, deduplicator, dedup_index):
+        super().__init__()
+        self.deduplicator = deduplicator
+        self.dedup_index = dedup_index
+
+    def run(self):
+        rankings = []
+        for _, rows in self.dedup_index.iter_groups():
+            try:
+                rankings.append(self.deduplicator.rank_group(self.dedup_index, rows))
+            except Exception as e:
+                print(f"质量排序错误: {e}")
+                rankings.append(list(range(len(rows))))
+        self.ranking_signal.emit(rankings)
 
 class ImageDeduplicationController(QMainWindow):
     def __init__(self):
@@ -250,8 +614,9 @@ class ImageDeduplicationController(QMainWindow):
         self.setGeometry(100, 100, 1200, 800)
         self.deduplicator = ImageDeduplicator()
         self.batch_cleaner = BatchFileCleaner()
-        self.image_paths = []
-        self.duplicate_groups = []
+        self.image_paths = PathTable()
+        self.dedup_index = None  # 列式查重结果
+        self.group_rankings = []  # 每组按质量从优到劣的组内下标
         self.generated_files = []  # 记录生成的文件
         self.init_ui()
 
@@ -291,6 +656,13 @@ class ImageDeduplicationController(QMainWindow):
         self.method_combo.addItems(["感知哈希", "SIFT特征匹配"])
         method_layout.addWidget(self.method_combo)
 
+        method_layout.addWidget(QLabel("哈希尺寸:"))
+        self.hash_size_combo = QComboBox()
+        # 界面中的感知哈希模式使用phash
+        self.hash_size_combo.addItems([f"{size}×{size}" for size in supported_hash_sizes('phash')])
+        self.hash_size_combo.currentIndexChanged.connect(self.update_threshold_range)
+        method_layout.addWidget(self.hash_size_combo)
+
         # 参数设置
         method_layout.addWidget(QLabel("阈值:"))
         self.threshold_slider = QSlider(Qt.Horizontal)
@@ -301,6 +673,14 @@ class ImageDeduplicationController(QMainWindow):
         self.threshold_slider.valueChanged.connect(lambda: self.threshold_label.setText(str(self.threshold_slider.value())))
         method_layout.addWidget(self.threshold_label)
 
+        method_layout.addWidget(QLabel("报告格式:"))
+        self.report_format_combo = QComboBox()
+        self.report_format_combo.addItems(["TXT"] + list(DuplicateReportWriter.FORMATS.keys()))
+        method_layout.addWidget(self.report_format_combo)
+        self.stream_report_check = QCheckBox("查重时写出报告")
+        self.stream_report_check.setToolTip("CSV/JSON Lines格式下每确定一组即写出记录，保留标记为质量最佳的文件")
+        method_layout.addWidget(self.stream_report_check)
+
         method_layout.addStretch()
         method_group.setLayout(method_layout)
         main_layout.addWidget(method_group)
@@ -384,6 +764,19 @@ class ImageDeduplicationController(QMainWindow):
 
         # 初始化工作线程
         self.worker_thread = None
+        self.ranking_thread = None
+
+    def current_hash_size(self):
+        return supported_hash_sizes('phash')[self.hash_size_combo.currentIndex()]
+
+    def update_threshold_range(self):
+        """按哈希位数等比例缩放阈值滑块范围（64位对应0-20）"""
+        old_maximum = self.threshold_slider.maximum()
+        bits = self.current_hash_size() ** 2
+        maximum = round(20 * bits / 64)
+        value = round(self.threshold_slider.value() * maximum / old_maximum) if old_maximum else 0
+        self.threshold_slider.setRange(0, maximum)
+        self.threshold_slider.setValue(value)
 
     def log_message(self, message):
         """添加日志消息"""
@@ -423,18 +816,36 @@ class ImageDeduplicationController(QMainWindow):
     def clear_list(self):
         self.image_list.clear()
         self.duplicate_tree.clear()
-        self.image_paths = []
-        self.duplicate_groups = []
+        self.image_paths = PathTable()
+        self.dedup_index = None
+        self.group_rankings = []
         self.preview_label.setText("图片预览")
         self.export_button.setEnabled(False)
         self.cleanup_button.setEnabled(False)
         self.log_message("已清空图片列表")
 
     def detect_duplicates(self):
-        if not self.image_paths:
+        if len(self.image_paths) == 0:
             QMessageBox.warning(self, "警告", "请先添加图片")
             return
 
+        # 查重时流式写出报告，需在开始前选择报告路径
+        report_path, report_extension = None, 'csv'
+        report_format = self.report_format_combo.currentText()
+        if self.stream_report_check.isChecked() and report_format in DuplicateReportWriter.FORMATS:
+            report_extension = DuplicateReportWriter.FORMATS[report_format]
+            report_path, _ = QFileDialog.getSaveFileName(
+                self, "选择报告保存位置", f"duplicates.{report_extension}",
+                f"{report_format} (*.{report_extension})"
+            )
+            if not report_path:
+                return
+            self.generated_files.append({
+                'path': report_path,
+                'description': '重复结果报告文件'
+            })
+            self.cleanup_button.setEnabled(True)
+
         # 禁用按钮，防止重复操作
         self.detect_button.setEnabled(False)
         self.progress_bar.setVisible(True)
@@ -443,9 +854,10 @@ class ImageDeduplicationController(QMainWindow):
         method = self.method_combo.currentText()
         threshold = self.threshold_slider.value()
 
-        # 创建工作线程
+        # 创建工作线程，传入路径表的副本，查重期间添加图片不会影响后台线程和查重结果
         self.worker_thread = DeduplicationThread(
-            self.deduplicator, self.image_paths, method, threshold
+            self.deduplicator, self.image_paths.copy(), method, threshold, self.current_hash_size(),
+            report_path, report_extension
         )
         
         # 连接信号
@@ -457,21 +869,28 @@ class ImageDeduplicationController(QMainWindow):
         self.worker_thread.start()
         self.log_message("开始查重处理...")
 
-    def on_detection_complete(self, duplicate_groups):
+    def has_duplicates(self):
+        return self.dedup_index is not None and self.dedup_index.group_count > 0
+
+    def on_detection_complete(self, dedup_index):
         """查重完成回调"""
-        self.duplicate_groups = duplicate_groups
+        self.dedup_index = dedup_index
+        self.group_rankings = []
         self.duplicate_tree.clear()
+        groups = dedup_index.iter_groups() if dedup_index is not None else []
         
         # 填充树形控件
-        for i, group in enumerate(duplicate_groups):
+        for i, rows in groups:
             group_item = QTreeWidgetItem(self.duplicate_tree)
-            group_item.setText(0, f"重复组 {i+1} ({len(group)} 个文件)")
+            group_item.setText(0, f"重复组 {i+1} ({len(rows)} 个文件)")
             group_item.setFlags(group_item.flags() | Qt.ItemIsAutoTristate)
             
-            for file_path in group:
+            for row in rows:
+                file_path = dedup_index.paths[row]
                 file_item = QTreeWidgetItem(group_item)
-                file_item.setText(0, os.path.basename(file_path))
+                file_item.setText(0, dedup_index.paths.basename(row))
                 file_item.setText(1, file_path)
+                file_item.setData(0, Qt.UserRole, int(row))
                 file_item.setCheckState(0, Qt.Unchecked)
                 file_item.setFlags(file_item.flags() | Qt.ItemIsUserCheckable)
                 
@@ -489,10 +908,11 @@ class ImageDeduplicationController(QMainWindow):
         self.detect_button.setEnabled(True)
         self.progress_bar.setVisible(False)
 
-        if self.duplicate_groups:
+        if self.has_duplicates():
             self.export_button.setEnabled(True)
-            self.log_message(f"查重完成，找到 {len(self.duplicate_groups)} 组重复图片")
-            QMessageBox.information(self, "完成", f"找到{len(self.duplicate_groups)}组重复图片")
+            self.start_quality_ranking()
+            self.log_message(f"查重完成，找到 {self.dedup_index.group_count} 组重复图片")
+            QMessageBox.information(self, "完成", f"找到{self.dedup_index.group_count}组重复图片")
         else:
             self.export_button.setEnabled(False)
             self.log_message("查重完成，未找到重复图片")
@@ -533,47 +953,48 @@ class ImageDeduplicationController(QMainWindow):
             if group_item.childCount() > 0:
                 group_item.child(0).setCheckState(0, Qt.Checked)
 
+    def start_quality_ranking(self):
+        """启动后台质量排序"""
+        self.ranking_thread = QualityRankingThread(self.deduplicator, self.dedup_index)
+        self.ranking_thread.ranking_signal.connect(self.on_ranking_complete)
+        self.ranking_thread.start()
+
+    def on_ranking_complete(self, rankings):
+        """质量排序完成回调，预选每组的最佳文件"""
+        self.group_rankings = rankings
+        self.auto_select_files()
+        self.log_message("已根据分辨率、位深、JPEG质量和清晰度预选保留文件")
+
     def auto_select_files(self):
-        """自动选择文件（基于文件大小和修改日期）"""
+        """自动选择文件（基于质量排序结果）"""
         for i in range(self.duplicate_tree.topLevelItemCount()):
             group_item = self.duplicate_tree.topLevelItem(i)
-            
-            # 收集文件信息
-            file_info = []
+            if i < len(self.group_rankings):
+                best = self.group_rankings[i][0]
+            else:
+                best = 0
+
+            # 先选中最好的文件，再取消选择其他文件，避免触发"至少保留一个"的提示
+            group_item.child(best).setCheckState(0, Qt.Checked)
             for j in range(group_item.childCount()):
-                file_path = group_item.child(j).text(1)
-                try:
-                    size = os.path.getsize(file_path)
-                    mtime = os.path.getmtime(file_path)
-                    file_info.append((j, size, mtime))
-                except:
-                    file_info.append((j, 0, 0))
-            
-            # 按文件大小和修改日期排序（优先保留较大的和较新的文件）
-            file_info.sort(key=lambda x: (x[1], x[2]), reverse=True)
-            
-            # 选择最好的文件，取消选择其他文件
-            for idx, (j, _, _) in enumerate(file_info):
-                if idx == 0:
-                    group_item.child(j).setCheckState(0, Qt.Checked)
-                else:
+                if j != best:
                     group_item.child(j).setCheckState(0, Qt.Unchecked)
 
-    def get_selected_files_to_delete(self):
-        """获取用户选择要删除的文件"""
-        files_to_delete = []
+    def get_selected_rows_to_delete(self):
+        """获取用户选择要删除的文件行号"""
+        rows_to_delete = []
         
         for i in range(self.duplicate_tree.topLevelItemCount()):
             group_item = self.duplicate_tree.topLevelItem(i)
             for j in range(group_item.childCount()):
                 file_item = group_item.child(j)
                 if file_item.checkState(0) == Qt.Unchecked:
-                    files_to_delete.append(file_item.text(1))
+                    rows_to_delete.append(file_item.data(0, Qt.UserRole))
         
-        return files_to_delete
+        return np.array(rows_to_delete, dtype=np.int64)
 
     def export_results(self):
-        if not self.duplicate_groups:
+        if not self.has_duplicates():
             return
 
         directory = QFileDialog.getExistingDirectory(self, "选择保存目录")
@@ -582,34 +1003,47 @@ class ImageDeduplicationController(QMainWindow):
 
         try:
             # 获取用户选择要删除的文件
-            files_to_delete = self.get_selected_files_to_delete()
+            paths = self.dedup_index.paths
+            rows_to_delete = self.get_selected_rows_to_delete()
             
-            if not files_to_delete:
+            if rows_to_delete.size == 0:
                 QMessageBox.information(self, "信息", "没有选择要删除的文件")
                 return
 
-            # 保存结果文本文件
-            txt_file = os.path.join(directory, "duplicates.txt")
-            with open(txt_file, "w", encoding='utf-8') as f:
-                f.write("重复图片组:\n")
-                for i, group in enumerate(self.duplicate_groups):
-                    f.write(f"\n组 {i+1}:\n")
-                    for file_path in group:
-                        f.write(f"  {file_path}\n")
-                
-                f.write(f"\n用户选择删除的文件 ({len(files_to_delete)} 个):\n")
-                for file_path in files_to_delete:
-                    f.write(f"  {file_path}\n")
+            report_format = self.report_format_combo.currentText()
+            if report_format == "TXT":
+                # 保存结果文本文件
+                report_file = os.path.join(directory, "duplicates.txt")
+                with open(report_file, "w", encoding='utf-8') as f:
+                    f.write("重复图片组:\n")
+                    for i, rows in self.dedup_index.iter_groups():
+                        f.write(f"\n组 {i+1}:\n")
+                        for row in rows:
+                            f.write(f"  {paths[row]}\n")
+                    
+                    f.write(f"\n用户选择删除的文件 ({rows_to_delete.size} 个):\n")
+                    for row in rows_to_delete:
+                        f.write(f"  {paths[row]}\n")
+            else:
+                # 逐组流式写出结构化报告
+                extension = DuplicateReportWriter.FORMATS[report_format]
+                report_file = os.path.join(directory, f"duplicates.{extension}")
+                kept_mask = np.zeros(len(self.dedup_index), dtype=np.bool_)
+                kept_mask[self.dedup_index.group_ids >= 0] = True
+                kept_mask[rows_to_delete] = False
+                record_count = self.deduplicator.write_report(
+                    self.dedup_index, report_file, extension, kept_mask)
+                self.log_message(f"已写出 {record_count} 条重复记录")
             
             self.generated_files.append({
-                'path': txt_file,
-                'description': '重复结果文本文件'
+                'path': report_file,
+                'description': '重复结果报告文件'
             })
 
             # 询问用户是否立即删除文件
             reply = QMessageBox.question(
                 self, "确认删除", 
-                f"确定要删除 {len(files_to_delete)} 个重复文件吗？此操作不可恢复！",
+                f"确定要删除 {rows_to_delete.size} 个重复文件吗？此操作不可恢复！",
                 QMessageBox.Yes | QMessageBox.No
             )
             
@@ -617,7 +1051,8 @@ class ImageDeduplicationController(QMainWindow):
                 deleted_count = 0
                 error_count = 0
                 
-                for file_path in files_to_delete:
+                for row in rows_to_delete:
+                    file_path = paths[row]
                     try:
                         if os.path.exists(file_path):
                             os.remove(file_path)
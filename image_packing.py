@@ -0,0 +1,474 @@
+import sys
+import os
+import json
+from functools import partial
+import numpy as np
+from PIL import Image
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
+                             QPushButton, QLabel, QFileDialog, QSpinBox, QMessageBox, QProgressBar,
+                             QListWidget, QListWidgetItem, QGroupBox, QCheckBox, QComboBox)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+
+class MaxRectsBin:
+    """MaxRects装箱，空闲矩形以numpy数组保存，评分和拆分全部向量化
+
+    heuristic: bottom_left 左下优先（未满页面更紧凑）; short_side 最短边最优适配。
+    """
+
+    def __init__(self, width, height, heuristic='bottom_left'):
+        self.width = width
+        self.height = height
+        self.heuristic = heuristic
+        self.free = np.array([[0, 0, width, height]], dtype=np.int64)  # 每行 [x, y, 宽, 高]
+        self.max_free_width = width
+        self.max_free_height = height
+
+    def find_position(self, width, height, allow_rotation=False):
+        """返回最佳放置 (评分, x, y, 是否旋转)，放不下时返回None"""
+        if not allow_rotation or width == height:
+            orientations = ((width, height, False),)
+        else:
+            orientations = ((width, height, False), (height, width, True))
+
+        best = None
+        free = self.free
+        for rect_width, rect_height, rotated in orientations:
+            if rect_width > self.max_free_width or rect_height > self.max_free_height:
+                continue
+            candidates = np.flatnonzero((free[:, 2] >= rect_width) & (free[:, 3] >= rect_height))
+            if len(candidates) == 0:
+                continue
+            if self.heuristic == 'short_side':
+                leftover_width = free[candidates, 2] - rect_width
+                leftover_height = free[candidates, 3] - rect_height
+                primary = np.minimum(leftover_width, leftover_height)
+                secondary = np.maximum(leftover_width, leftover_height)
+            else:
+                primary = free[candidates, 1] + rect_height
+                secondary = free[candidates, 0]
+            k = np.lexsort((secondary, primary))[0]
+            score = (int(primary[k]), int(secondary[k]))
+            if best is None or score < best[0]:
+                best = (score, int(free[candidates[k], 0]), int(free[candidates[k], 1]), rotated)
+        return best
+
+    def place(self, x, y, width, height):
+        """占用矩形，拆分与之相交的空闲矩形并剔除被包含的空闲矩形"""
+        free = self.free
+        x1, y1 = x + width, y + height
+        overlap = ((free[:, 0] < x1) & (free[:, 0] + free[:, 2] > x) &
+                   (free[:, 1] < y1) & (free[:, 1] + free[:, 3] > y))
+        kept = free[~overlap]
+        hit = free[overlap]
+        hx, hy, hw, hh = hit[:, 0], hit[:, 1], hit[:, 2], hit[:, 3]
+        hx1, hy1 = hx + hw, hy + hh
+
+        # 每个相交的空闲矩形最多拆成左、右、上、下四个最大矩形
+        pieces = np.concatenate([
+            np.stack((hx, hy, x - hx, hh), axis=1)[x > hx],
+            np.stack((np.full_like(hx, x1), hy, hx1 - x1, hh), axis=1)[x1 < hx1],
+            np.stack((hx, hy, hw, y - hy), axis=1)[y > hy],
+            np.stack((hx, np.full_like(hy, y1), hw, hy1 - y1), axis=1)[y1 < hy1],
+        ])
+
+        if len(pieces):
+            # 新矩形被保留矩形包含（含相等）时丢弃
+            pieces = pieces[~contains(kept, pieces).any(axis=0)]
+        if len(pieces):
+            # 新矩形之间互相包含时保留较大者，完全相同时保留第一个
+            inside = contains(pieces, pieces)
+            equal = inside & inside.T
+            order = np.arange(len(pieces))
+            inside &= ~(equal & (order[None, :] >= order[:, None]))
+            pieces = pieces[~inside.any(axis=0)]
+            # 保留矩形被新矩形严格包含时丢弃
+            kept = kept[~contains(pieces, kept).any(axis=0)]
+
+        self.free = np.concatenate((kept, pieces))
+        if len(self.free):
+            self.max_free_width = int(self.free[:, 2].max())
+            self.max_free_height = int(self.free[:, 3].max())
+        else:
+            self.max_free_width = self.max_free_height = 0
+
+class SkylineBin:
+    """Skyline装箱（左下优先），轮廓线区间最大值用稀疏表向量化查询"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        # 轮廓线线段: 起点x、高度y、宽度
+        self.xs = np.array([0], dtype=np.int64)
+        self.ys = np.array([0], dtype=np.int64)
+        self.ws = np.array([width], dtype=np.int64)
+        self.max_free_height = height  # 轮廓线最低点以上的剩余高度
+
+    def span_heights(self, width):
+        """对每条线段作为起点，求宽度width覆盖范围内轮廓线的最高点，越界时为-1"""
+        xs, ys = self.xs, self.ys
+        count = len(xs)
+        ends = np.searchsorted(xs, xs + width, side='left')  # 覆盖 [i, ends[i]) 条线段
+        valid = xs + width <= self.width
+        # 稀疏表: table[k][i] = max(ys[i : i + 2^k])
+        table = [ys]
+        while (1 << len(table)) <= count:
+            previous = table[-1]
+            step = 1 << (len(table) - 1)
+            table.append(np.maximum(previous[:-step], previous[step:]))
+        lengths = np.maximum(ends - np.arange(count), 1)
+        levels = np.floor(np.log2(lengths)).astype(np.int64)
+        heights = np.full(count, -1, dtype=np.int64)
+        starts = np.arange(count)
+        for level in np.unique(levels[valid]):
+            rows = np.flatnonzero(valid & (levels == level))
+            level_table = table[level]
+            heights[rows] = np.maximum(level_table[starts[rows]], level_table[ends[rows] - (1 << level)])
+        return heights
+
+    def find_position(self, width, height, allow_rotation=False):
+        """返回最佳放置 (评分, x, y, 是否旋转)，评分为 (顶边高度, x)，放不下时返回None"""
+        if not allow_rotation or width == height:
+            orientations = ((width, height, False),)
+        else:
+            orientations = ((width, height, False), (height, width, True))
+
+        best = None
+        for rect_width, rect_height, rotated in orientations:
+            if rect_width > self.width or rect_height > self.max_free_height:
+                continue
+            heights = self.span_heights(rect_width)
+            tops = np.where((heights >= 0) & (heights + rect_height <= self.height), heights + rect_height, -1)
+            candidates = np.flatnonzero(tops >= 0)
+            if len(candidates) == 0:
+                continue
+            k = candidates[np.lexsort((self.xs[candidates], tops[candidates]))[0]]
+            score = (int(tops[k]), int(self.xs[k]))
+            if best is None or score < best[0]:
+                best = (score, int(self.xs[k]), int(heights[k]), rotated)
+        return best
+
+    def place(self, x, y, width, height):
+        """在x处放置矩形后更新轮廓线并合并等高的相邻线段"""
+        xs, ys, ws = self.xs, self.ys, self.ws
+        x1 = x + width
+        ends = xs + ws
+        left = xs < x
+        right = ends > x1
+        # 右侧被部分覆盖的线段截掉被覆盖部分
+        clipped = (xs < x1) & right & ~left
+        new_xs = np.where(clipped, x1, xs)
+        new_ws = np.where(clipped, ends - x1, ws)
+        keep = left | right
+        xs = np.concatenate((new_xs[keep], [x]))
+        ys = np.concatenate((ys[keep], [y + height]))
+        ws = np.concatenate((new_ws[keep], [width]))
+        order = np.argsort(xs, kind='stable')
+        xs, ys, ws = xs[order], ys[order], ws[order]
+
+        # 合并等高的相邻线段
+        starts = np.concatenate(([True], ys[1:] != ys[:-1]))
+        group_starts = np.flatnonzero(starts)
+        self.xs = xs[group_starts]
+        self.ys = ys[group_starts]
+        self.ws = np.add.reduceat(ws, group_starts)
+        self.max_free_height = self.height - int(self.ys.min())
+
+def contains(outer, inner):
+    """contains[i, j] 为 outer[i] 是否包含 inner[j]"""
+    return ((outer[:, None, 0] <= inner[None, :, 0]) &
+            (outer[:, None, 1] <= inner[None, :, 1]) &
+            (outer[:, None, 0] + outer[:, None, 2] >= inner[None, :, 0] + inner[None, :, 2]) &
+            (outer[:, None, 1] + outer[:, None, 3] >= inner[None, :, 1] + inner[None, :, 3]))
+
+# 装箱算法: 界面名称 -> 内部标识
+PACKING_METHODS = {
+    'MaxRects 左下优先': 'maxrects',
+    'MaxRects 最短边适配': 'maxrects_bssf',
+    'Skyline': 'skyline',
+}
+
+PACKERS = {
+    'maxrects': MaxRectsBin,
+    'maxrects_bssf': partial(MaxRectsBin, heuristic='short_side'),
+    'skyline': SkylineBin,
+}
+
+def pack_rects(sizes, page_width, page_height, method='maxrects', allow_rotation=False, padding=0):
+    """把矩形装入若干页，返回 (放置表, 页数)
+
+    放置表每行为 [页号, x, y, 是否旋转]，按输入顺序排列；旋转表示在图集中顺时针旋转了90度。
+    """
+    sizes = np.asarray(sizes, dtype=np.int64).reshape(-1, 2)
+    placements = np.zeros((len(sizes), 4), dtype=np.int64)
+    if len(sizes) == 0:
+        return placements, 0
+
+    # 元素之间留出padding，页面同样扩展padding使最右和最下的元素不必留白
+    padded = sizes + padding
+    bin_width, bin_height = page_width + padding, page_height + padding
+    fits = (padded[:, 0] <= bin_width) & (padded[:, 1] <= bin_height)
+    if allow_rotation:
+        fits |= (padded[:, 1] <= bin_width) & (padded[:, 0] <= bin_height)
+    if not fits.all():
+        raise ValueError(f"有 {int((~fits).sum())} 个元素超过图集页面尺寸")
+
+    # 先放长边大、面积大的矩形
+    order = np.lexsort((-(padded[:, 0] * padded[:, 1]), -padded.max(axis=1)))
+    bins = []
+    for idx in order:
+        width, height = int(padded[idx, 0]), int(padded[idx, 1])
+        for page, packing_bin in enumerate(bins):
+            position = packing_bin.find_position(width, height, allow_rotation)
+            if position is not None:
+                break
+        else:
+            packing_bin = PACKERS[method](bin_width, bin_height)
+            bins.append(packing_bin)
+            page = len(bins) - 1
+            position = packing_bin.find_position(width, height, allow_rotation)
+
+        _, x, y, rotated = position
+        if rotated:
+            packing_bin.place(x, y, height, width)
+        else:
+            packing_bin.place(x, y, width, height)
+        placements[idx] = (page, x, y, rotated)
+    return placements, len(bins)
+
+def page_extents(sizes, placements, page_count):
+    """每页实际使用的宽高（裁掉右侧和下方的空白）"""
+    sizes = np.asarray(sizes, dtype=np.int64).reshape(-1, 2)
+    rotated = placements[:, 3].astype(bool)
+    widths = np.where(rotated, sizes[:, 1], sizes[:, 0])
+    heights = np.where(rotated, sizes[:, 0], sizes[:, 1])
+    extents = np.zeros((page_count, 2), dtype=np.int64)
+    np.maximum.at(extents[:, 0], placements[:, 0], placements[:, 1] + widths)
+    np.maximum.at(extents[:, 1], placements[:, 0], placements[:, 2] + heights)
+    return extents
+
+def packing_efficiency(sizes, placements, page_count):
+    """元素总面积占各页实际使用面积的比例"""
+    sizes = np.asarray(sizes, dtype=np.int64).reshape(-1, 2)
+    if page_count == 0:
+        return 1.0
+    extents = page_extents(sizes, placements, page_count)
+    return float((sizes[:, 0] * sizes[:, 1]).sum() / (extents[:, 0] * extents[:, 1]).sum())
+
+class AtlasPacker:
+    """把一组图片打包为图集页和坐标清单"""
+
+    def __init__(self, page_size=2048, method='maxrects', allow_rotation=False, padding=2):
+        self.page_size = page_size
+        self.method = method
+        self.allow_rotation = allow_rotation
+        self.padding = padding
+
+    def read_sizes(self, image_paths):
+        """只读取图像头获取尺寸"""
+        sizes = np.zeros((len(image_paths), 2), dtype=np.int64)
+        for idx, image_path in enumerate(image_paths):
+            with Image.open(image_path) as image:
+                sizes[idx] = image.size
+        return sizes
+
+    def pack(self, image_paths, output_dir, base_name='atlas', progress_callback=None):
+        """打包并写出图集页PNG和 {base_name}.json 清单，返回 (页数, 装箱效率)"""
+        sizes = self.read_sizes(image_paths)
+        placements, page_count = pack_rects(sizes, self.page_size, self.page_size, self.method,
+                                            self.allow_rotation, self.padding)
+        extents = page_extents(sizes, placements, page_count)
+
+        pages = []
+        for page in range(page_count):
+            page_width, page_height = (int(value) for value in extents[page])
+            canvas = np.zeros((page_height, page_width, 4), dtype=np.uint8)
+            for idx in np.flatnonzero(placements[:, 0] == page):
+                _, x, y, rotated = placements[idx]
+                with Image.open(image_paths[idx]) as image:
+                    sprite = np.asarray(image.convert('RGBA'))
+                if rotated:
+                    sprite = np.rot90(sprite, -1)  # 顺时针旋转90度
+                canvas[y:y + sprite.shape[0], x:x + sprite.shape[1]] = sprite
+            file_name = f"{base_name}_{page}.png"
+            Image.fromarray(canvas).save(os.path.join(output_dir, file_name))
+            pages.append({'file': file_name, 'width': page_width, 'height': page_height})
+            if progress_callback:
+                progress_callback(page + 1, page_count)
+
+        sprites = []
+        for idx, image_path in enumerate(image_paths):
+            page, x, y, rotated = (int(value) for value in placements[idx])
+            sprites.append({
+                'name': os.path.basename(image_path),
+                'source': os.path.abspath(image_path),
+                'page': page,
+                'x': x,
+                'y': y,
+                'width': int(sizes[idx, 0]),   # 原始宽高，旋转时在图集中宽高互换
+                'height': int(sizes[idx, 1]),
+                'rotated': bool(rotated),
+            })
+        manifest = {'method': self.method, 'padding': self.padding, 'pages': pages, 'sprites': sprites}
+        with open(os.path.join(output_dir, f"{base_name}.json"), "w", encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return page_count, packing_efficiency(sizes, placements, page_count)
+
+class PackingThread(QThread):
+    progress_updated = pyqtSignal(int, int)  # 已完成页数, 总页数
+    finished = pyqtSignal(int, float, str)  # 页数, 装箱效率, 错误信息
+
+    def __init__(self, packer, image_paths, output_dir, base_name):
+        super().__init__()
+        self.packer = packer
+        self.image_paths = image_paths
+        self.output_dir = output_dir
+        self.base_name = base_name
+
+    def run(self):
+        try:
+            page_count, efficiency = self.packer.pack(self.image_paths, self.output_dir, self.base_name,
+                                                      self.progress_updated.emit)
+            self.finished.emit(page_count, efficiency, "")
+        except Exception as e:
+            print(f"图集打包错误: {str(e)}")
+            self.finished.emit(0, 0.0, str(e))
+
+class AtlasPackingController(QMainWindow):
+    def __init__(self, image_paths=None):
+        super().__init__()
+        self.image_paths = []
+        self.output_dir = ""
+        self.packing_thread = None
+        self.initUI()
+        if image_paths:
+            self.add_paths(image_paths)
+
+    def initUI(self):
+        self.setWindowTitle('ImageCF-图集打包工具')
+        self.setGeometry(150, 150, 700, 500)
+
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+
+        # 顶部按钮区域
+        top_layout = QHBoxLayout()
+        self.btn_add = QPushButton('添加图片')
+        self.btn_add.clicked.connect(self.add_images)
+        self.btn_clear = QPushButton('清空列表')
+        self.btn_clear.clicked.connect(self.clear_list)
+        self.btn_output = QPushButton('选择输出目录')
+        self.btn_output.clicked.connect(self.select_output_dir)
+        self.btn_pack = QPushButton('开始打包')
+        self.btn_pack.clicked.connect(self.pack_atlas)
+        top_layout.addWidget(self.btn_add)
+        top_layout.addWidget(self.btn_clear)
+        top_layout.addWidget(self.btn_output)
+        top_layout.addWidget(self.btn_pack)
+        main_layout.addLayout(top_layout)
+
+        self.list_images = QListWidget()
+        main_layout.addWidget(self.list_images)
+
+        # 参数设置
+        params_group = QGroupBox("打包参数")
+        params_layout = QHBoxLayout()
+        params_layout.addWidget(QLabel('页面尺寸:'))
+        self.spin_page_size = QSpinBox()
+        self.spin_page_size.setRange(64, 16384)
+        self.spin_page_size.setSingleStep(256)
+        self.spin_page_size.setValue(2048)
+        params_layout.addWidget(self.spin_page_size)
+        params_layout.addWidget(QLabel('间距:'))
+        self.spin_padding = QSpinBox()
+        self.spin_padding.setRange(0, 64)
+        self.spin_padding.setValue(2)
+        params_layout.addWidget(self.spin_padding)
+        params_layout.addWidget(QLabel('算法:'))
+        self.combo_method = QComboBox()
+        self.combo_method.addItems(list(PACKING_METHODS.keys()))
+        params_layout.addWidget(self.combo_method)
+        self.cb_rotation = QCheckBox('允许旋转')
+        params_layout.addWidget(self.cb_rotation)
+        params_layout.addStretch()
+        params_group.setLayout(params_layout)
+        main_layout.addWidget(params_group)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        main_layout.addWidget(self.progress_bar)
+        self.lbl_status = QLabel('准备就绪')
+        main_layout.addWidget(self.lbl_status)
+
+    def add_paths(self, paths):
+        for path in paths:
+            if path not in self.image_paths:
+                item = QListWidgetItem(os.path.basename(path))
+                item.setData(Qt.UserRole, path)
+                self.list_images.addItem(item)
+                self.image_paths.append(path)
+        self.lbl_status.setText(f"共 {len(self.image_paths)} 张图片")
+
+    def add_images(self):
+        files, _ = QFileDialog.getOpenFileNames(
+            self, "选择图片", "",
+            "图片文件 (*.png *.jpg *.jpeg *.bmp);;所有文件 (*)"
+        )
+        if files:
+            self.add_paths(files)
+
+    def clear_list(self):
+        self.list_images.clear()
+        self.image_paths = []
+        self.lbl_status.setText("已清空图片列表")
+
+    def select_output_dir(self):
+        directory = QFileDialog.getExistingDirectory(self, "选择输出目录")
+        if directory:
+            self.output_dir = directory
+            self.lbl_status.setText(f"输出目录: {directory}")
+
+    def pack_atlas(self):
+        if not self.image_paths:
+            QMessageBox.warning(self, "警告", "请先添加图片！")
+            return
+        if not self.output_dir:
+            QMessageBox.warning(self, "警告", "请选择输出目录！")
+            return
+
+        packer = AtlasPacker(self.spin_page_size.value(), PACKING_METHODS[self.combo_method.currentText()],
+                             self.cb_rotation.isChecked(), self.spin_padding.value())
+        self.btn_pack.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.lbl_status.setText("正在装箱...")
+        self.packing_thread = PackingThread(packer, list(self.image_paths), self.output_dir, 'atlas')
+        self.packing_thread.progress_updated.connect(self.update_progress)
+        self.packing_thread.finished.connect(self.on_packing_finished)
+        self.packing_thread.start()
+
+    def update_progress(self, done, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.lbl_status.setText(f"正在写出图集页: {done}/{total}")
+
+    def on_packing_finished(self, page_count, efficiency, error):
+        self.btn_pack.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        if error:
+            QMessageBox.critical(self, "错误", f"图集打包失败: {error}")
+            self.lbl_status.setText("打包失败")
+            return
+        self.lbl_status.setText(f"打包完成: {page_count} 页，装箱效率 {efficiency:.1%}")
+        QMessageBox.information(self, "完成", f"已生成 {page_count} 页图集，装箱效率 {efficiency:.1%}")
+
+    def closeEvent(self, event):
+        if self.packing_thread and self.packing_thread.isRunning():
+            self.packing_thread.wait()
+        event.accept()
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    ex = AtlasPackingController()
+    ex.show()
+    sys.exit(app.exec_())
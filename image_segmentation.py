@@ -1,30 +1,715 @@
 import sys
 import os
 import numpy as np
+import cv2
+from scipy import ndimage
+import json
+import csv
+import struct
+import zipfile
+import hashlib
+from collections import deque
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from PIL import Image, ImageDraw
+from file_utils import write_file_atomic
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLabel, QFileDialog, QSpinBox, QMessageBox, QProgressBar,
-                             QListWidget, QListWidgetItem, QSlider, QGroupBox, QCheckBox, QSplitter)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QPixmap, QImage, QIcon
+                             QListWidget, QListWidgetItem, QSlider, QGroupBox, QCheckBox, QSplitter,
+                             QComboBox, QDoubleSpinBox)
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QPixmap, QImage, QIcon, QPainter, QPen, QColor
+
+# 统计表列: 包围盒 x, y, 宽, 高, 像素数, 像素x坐标之和, 像素y坐标之和
+# 坐标和（而非质心）可在条带拼接和碎片合并时直接相加
+STAT_COLUMNS = 7
+
+class ScipyComponentBackend:
+    """基于scipy.ndimage的连通域统计：find_objects取包围盒，按行分块用bincount计像素数和坐标和"""
+    name = 'scipy'
+    CHUNK_PIXELS = 1 << 20  # 每块的像素数，坐标权重数组只占一块的大小，不随整图增长
+
+    def compute_stats(self, binary_image):
+        """返回 (标记图, 统计表)，统计表每行为 [x, y, 宽, 高, 像素数, x坐标和, y坐标和]，不含背景"""
+        labeled_array, num_features = ndimage.label(binary_image)
+        height, width = labeled_array.shape
+        length = num_features + 1
+        counts = np.zeros(length, dtype=np.int64)
+        sum_x = np.zeros(length)
+        sum_y = np.zeros(length)
+        rows_per_chunk = max(1, self.CHUNK_PIXELS // max(width, 1))
+        column_weights = np.tile(np.arange(width, dtype=np.float64), rows_per_chunk)
+        for y0 in range(0, height, rows_per_chunk):
+            strip = labeled_array[y0:y0 + rows_per_chunk]
+            chunk_labels = strip.ravel()
+            counts += np.bincount(chunk_labels, minlength=length)
+            sum_x += np.bincount(chunk_labels, weights=column_weights[:chunk_labels.size], minlength=length)
+            # 每行各标记的像素数乘以行号即为y坐标和
+            row_weights = np.repeat(np.arange(y0, y0 + len(strip), dtype=np.float64), width)
+            sum_y += np.bincount(chunk_labels, weights=row_weights, minlength=length)
+        counts, sum_x, sum_y = counts[1:], sum_x[1:], sum_y[1:]
+        bounds = np.array([(cols.start, rows.start, cols.stop, rows.stop)
+                           for rows, cols in ndimage.find_objects(labeled_array)], dtype=np.int64).reshape(-1, 4)
+        stats = np.empty((num_features, STAT_COLUMNS), dtype=np.int64)
+        stats[:, :2] = bounds[:, :2]
+        stats[:, 2:4] = bounds[:, 2:] - bounds[:, :2]
+        stats[:, 4] = counts
+        stats[:, 5] = np.rint(sum_x)
+        stats[:, 6] = np.rint(sum_y)
+        return labeled_array, stats
+
+class OpenCVComponentBackend:
+    """基于cv2.connectedComponentsWithStats的连通域统计"""
+    name = 'opencv'
+
+    def compute_stats(self, binary_image):
+        """返回 (标记图, 统计表)，与scipy后端一致使用4连通和光栅扫描顺序编号"""
+        # SAUF为顺序扫描算法，标记顺序与scipy.ndimage.label相同
+        _, labeled_array, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+            binary_image, 4, cv2.CV_32S, cv2.CCL_SAUF)
+        result = np.empty((len(stats) - 1, STAT_COLUMNS), dtype=np.int64)
+        result[:, :5] = stats[1:]
+        # 质心乘像素数还原为坐标和
+        result[:, 5:7] = np.rint(centroids[1:] * stats[1:, 4:5])
+        return labeled_array, result
+
+COMPONENT_BACKENDS = {
+    'scipy': ScipyComponentBackend,
+    'opencv': OpenCVComponentBackend,
+}
+
+def verify_component_backends(binary_image):
+    """检查所有连通域后端对同一二值图的输出是否完全一致"""
+    results = [COMPONENT_BACKENDS[name]().compute_stats(binary_image) for name in COMPONENT_BACKENDS]
+    reference_labels, reference_stats = results[0]
+    return all(np.array_equal(labels, reference_labels) and np.array_equal(stats, reference_stats)
+               for labels, stats in results[1:])
+
+class ImageStripSource:
+    """按行条带读取RGBA像素：.npy文件通过内存映射读取，其他格式由Pillow解码后逐条带转换
+
+    只有.npy来源的峰值内存受条带高度限制；PNG/JPEG等格式在首次读取时会被Pillow完整解码，
+    内存占用与整图解码相同。超大图集应先用 convert_to_npy 转换一次（界面中的"转换为.npy"）。
+    """
+
+    def __init__(self, image_path):
+        self.image_path = image_path
+        self.array = None
+        self.image = None
+        if image_path.lower().endswith('.npy'):
+            self.array = np.load(image_path, mmap_mode='r')
+            self.height, self.width = self.array.shape[:2]
+        else:
+            # 分块模式用于超大图集，需放开Pillow的像素数量保护
+            max_pixels = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = None
+            try:
+                self.image = Image.open(image_path)
+            finally:
+                Image.MAX_IMAGE_PIXELS = max_pixels
+            self.width, self.height = self.image.size
+
+    def read_rows(self, y0, y1, x0=0, x1=None):
+        """读取 [y0, y1) 行、[x0, x1) 列的RGBA数组"""
+        x1 = self.width if x1 is None else x1
+        if self.array is not None:
+            return np.ascontiguousarray(self.array[y0:y1, x0:x1])
+        return np.asarray(self.image.crop((x0, y0, x1, y1)).convert('RGBA'))
+
+    def close(self):
+        if self.image is not None:
+            self.image.close()
+        self.array = None
+
+    @staticmethod
+    def convert_to_npy(image_path, npy_path, strip_height=1024):
+        """把图像逐条带写入内存映射的.npy文件，之后的分块处理无需再次解码
+
+        转换本身仍需完整解码一次原图（Pillow不支持按条带解码PNG/JPEG），但只需做一次，
+        之后的分块处理峰值内存只与条带高度有关。
+        """
+        source = ImageStripSource(image_path)
+        try:
+            output = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.uint8,
+                                               shape=(source.height, source.width, 4))
+            for y0 in range(0, source.height, strip_height):
+                y1 = min(source.height, y0 + strip_height)
+                output[y0:y1] = source.read_rows(y0, y1)
+            output.flush()
+            del output
+        finally:
+            source.close()
+        return npy_path
+
+def merge_strip_components(strip_stats, seam_pairs):
+    """用并查集合并跨条带接缝的连通域，返回按光栅扫描顺序排列的统计表"""
+    if not strip_stats:
+        return np.zeros((0, STAT_COLUMNS), dtype=np.int64)
+    stats = np.concatenate(strip_stats)
+    if len(stats) == 0:
+        return stats
+    # 全局标记从1开始，parent下标0为占位
+    parent = np.arange(len(stats) + 1, dtype=np.int64)
+
+    def find(label):
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    # 合并时以较小标记为根，根即为该连通域在光栅顺序中最先出现的部分
+    for a, b in seam_pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    # 指针跳跃，把每个标记直接指向根
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+
+    roots = parent[1:]
+    order = np.argsort(roots, kind='stable')
+    sorted_roots = roots[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_roots)) + 1))
+    ordered = stats[order]
+    min_x = np.minimum.reduceat(ordered[:, 0], starts)
+    min_y = np.minimum.reduceat(ordered[:, 1], starts)
+    max_x = np.maximum.reduceat(ordered[:, 0] + ordered[:, 2], starts)
+    max_y = np.maximum.reduceat(ordered[:, 1] + ordered[:, 3], starts)
+    merged = np.empty((len(starts), stats.shape[1]), dtype=np.int64)
+    merged[:, 0] = min_x
+    merged[:, 1] = min_y
+    merged[:, 2] = max_x - min_x
+    merged[:, 3] = max_y - min_y
+    # 像素数和坐标和直接累加
+    merged[:, 4:] = np.add.reduceat(ordered[:, 4:], starts, axis=0)
+    return merged
+
+def component_statistics(stats):
+    """由统计表计算每个连通域的像素数、质心、填充率和长宽比（长边/短边）"""
+    stats = np.asarray(stats, dtype=np.int64).reshape(-1, STAT_COLUMNS)
+    widths = stats[:, 2].astype(np.float64)
+    heights = stats[:, 3].astype(np.float64)
+    pixel_counts = stats[:, 4]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'pixel_count': pixel_counts,
+            'centroid_x': stats[:, 5] / pixel_counts,
+            'centroid_y': stats[:, 6] / pixel_counts,
+            'fill_ratio': pixel_counts / (widths * heights),
+            'aspect_ratio': np.maximum(widths, heights) / np.minimum(widths, heights),
+        }
+
+def write_component_stats(stats, kept_mask, output_path):
+    """把连通域统计表写为CSV，kept列标记是否通过过滤，element_index对应导出的元素序号"""
+    values = component_statistics(stats)
+    element_indices = np.cumsum(kept_mask)
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['component', 'x', 'y', 'width', 'height', 'pixel_count', 'centroid_x', 'centroid_y',
+                         'fill_ratio', 'aspect_ratio', 'kept', 'element_index'])
+        for idx, row in enumerate(stats):
+            kept = bool(kept_mask[idx])
+            writer.writerow([idx + 1, int(row[0]), int(row[1]), int(row[2]), int(row[3]), int(row[4]),
+                             f"{values['centroid_x'][idx]:.3f}", f"{values['centroid_y'][idx]:.3f}",
+                             f"{values['fill_ratio'][idx]:.4f}", f"{values['aspect_ratio'][idx]:.4f}",
+                             int(kept), int(element_indices[idx]) if kept else ''])
+
+def find_nearby_pairs(stats, distance):
+    """用网格哈希查找包围盒间距不超过distance的连通域对，返回1起始的标记对
+
+    每个包围盒向外扩展后登记到其覆盖的网格单元，只有同一单元内的包围盒才做精确间距检查。
+    """
+    count = len(stats)
+    if distance <= 0 or count < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    # 两个包围盒各扩展half后有重叠像素，当且仅当间距 <= 2*half-1
+    half = (distance + 2) // 2
+    x0 = stats[:, 0] - half
+    y0 = stats[:, 1] - half
+    x1 = stats[:, 0] + stats[:, 2] - 1 + half
+    y1 = stats[:, 1] + stats[:, 3] - 1 + half
+    # 单元边长取典型元素尺寸，使每个包围盒只覆盖少量单元
+    cell = int(max(distance + 1, np.median(np.maximum(stats[:, 2], stats[:, 3])) + 2 * half))
+    cx0, cy0 = x0 // cell, y0 // cell
+    nx = x1 // cell - cx0 + 1
+    ny = y1 // cell - cy0 + 1
+    cells_per_box = nx * ny
+
+    # 展开 (单元, 包围盒) 登记表
+    box = np.repeat(np.arange(count, dtype=np.int64), cells_per_box)
+    offset = np.arange(len(box), dtype=np.int64) - np.repeat(np.cumsum(cells_per_box) - cells_per_box, cells_per_box)
+    gx = cx0[box] + offset % nx[box]
+    gy = cy0[box] + offset // nx[box]
+    gx -= gx.min()
+    gy -= gy.min()
+    key = gy * (gx.max() + 1) + gx
+    order = np.argsort(key, kind='stable')
+    key, box = key[order], box[order]
+
+    # 同一单元内的登记在排序后连续，按间隔shift逐轮生成候选对
+    candidates = []
+    shift = 1
+    while shift < len(key):
+        same_cell = np.flatnonzero(key[shift:] == key[:-shift])
+        if len(same_cell) == 0:
+            break
+        candidates.append(np.stack((box[same_cell], box[same_cell + shift]), axis=1))
+        shift += 1
+    if not candidates:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.unique(np.sort(np.concatenate(candidates), axis=1), axis=0)
+
+    # 精确检查水平和垂直间距
+    a, b = pairs[:, 0], pairs[:, 1]
+    gap_x = np.maximum(stats[a, 0], stats[b, 0]) - np.minimum(stats[a, 0] + stats[a, 2], stats[b, 0] + stats[b, 2])
+    gap_y = np.maximum(stats[a, 1], stats[b, 1]) - np.minimum(stats[a, 1] + stats[a, 3], stats[b, 1] + stats[b, 3])
+    close = (gap_x <= distance) & (gap_y <= distance)
+    return pairs[close] + 1
+
+def compute_foreground_mask(image_array, threshold, alpha_threshold, use_alpha=True, use_white=True,
+                            out=None, scratch=None):
+    """融合计算前景掩码，直接写入预分配的uint8缓冲区（1为前景）
+
+    背景条件: alpha < alpha_threshold，或 r、g、b 均大于threshold且alpha > 200。
+    alpha比较在打包的uint32像素上进行，白色判断用三通道最小值，全部通过out=避免临时数组。
+    """
+    height, width = image_array.shape[:2]
+    if out is None:
+        out = np.empty((height, width), dtype=np.uint8)
+    if scratch is None:
+        scratch = np.empty((height, width), dtype=np.uint8)
+    mask = out.view(np.bool_)
+    scratch_mask = scratch.view(np.bool_)
+
+    if image_array.flags.c_contiguous and sys.byteorder == 'little':
+        # 小端序下打包像素的最高字节即alpha，alpha >= t 等价于 packed >= t << 24
+        packed = image_array.view(np.uint32).reshape(height, width)
+        alpha_at_least = lambda value, target: np.greater_equal(packed, np.uint32(value << 24), out=target)
+        alpha_at_most = lambda value, target: np.less(packed, np.uint32((value + 1) << 24), out=target)
+    else:
+        alpha = image_array[:, :, 3]
+        alpha_at_least = lambda value, target: np.greater_equal(alpha, value, out=target)
+        alpha_at_most = lambda value, target: np.less_equal(alpha, value, out=target)
+
+    if not use_white:
+        # 仅alpha检测（未选择任何检测方式时同样默认使用alpha检测）
+        alpha_at_least(alpha_threshold, mask)
+        return out
+
+    # 非白色: min(r, g, b) <= threshold 或 alpha <= 200
+    np.minimum(image_array[:, :, 0], image_array[:, :, 1], out=scratch)
+    np.minimum(scratch, image_array[:, :, 2], out=scratch)
+    np.less_equal(scratch, threshold, out=mask)
+    alpha_at_most(200, scratch_mask)
+    np.logical_or(mask, scratch_mask, out=mask)
+
+    if use_alpha:
+        alpha_at_least(alpha_threshold, scratch_mask)
+        np.logical_and(mask, scratch_mask, out=mask)
+    return out
+
+def encode_png(rgba_array, compress_level=6, fast_filter=False):
+    """把RGBA数组编码为PNG，fast_filter只尝试libpng的快速滤波器组合"""
+    params = [int(cv2.IMWRITE_PNG_COMPRESSION), compress_level]
+    if fast_filter and hasattr(cv2, 'IMWRITE_PNG_FILTER'):
+        params += [int(cv2.IMWRITE_PNG_FILTER), int(cv2.IMWRITE_PNG_FAST_FILTERS)]
+    success, encoded = cv2.imencode('.png', cv2.cvtColor(np.ascontiguousarray(rgba_array), cv2.COLOR_RGBA2BGRA),
+                                    params)
+    if not success:
+        raise ValueError("PNG编码失败")
+    return encoded
+
+def content_bounds(row_any, column_any):
+    """由行、列投影求内容包围盒 (x, y, 宽, 高)，没有内容时返回None"""
+    rows = np.flatnonzero(row_any)
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(column_any)
+    return int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)
+
+def hash_element(region):
+    """按像素内容计算元素的BLAKE2摘要（形状参与哈希，避免不同尺寸的相同字节冲突）"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.asarray(region.shape, dtype='<i8').tobytes())
+    digest.update(np.ascontiguousarray(region).data)
+    return digest.hexdigest()
+
+def read_zip_data_offsets(zip_path):
+    """读取ZIP中每个成员数据区的 (偏移, 长度)，用于按偏移直接读取未压缩成员"""
+    entries = {}
+    with zipfile.ZipFile(zip_path) as archive, open(zip_path, 'rb') as f:
+        for info in archive.infolist():
+            # 本地文件头固定30字节，其后为文件名和扩展字段
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            entries[info.filename] = (info.header_offset + 30 + name_length + extra_length, info.file_size)
+    return entries
+
+# 导出方式: 界面名称 -> 内部标识
+EXPORT_MODES = {
+    '单独PNG文件': 'png',
+    '仅清单(JSON)': 'manifest',
+    '清单+ZIP打包': 'zip',
+}
+
+class ElementExtractor:
+    """UI元素提取器：背景掩码 -> 连通域统计 -> 面积过滤 -> 导出"""
+
+    def __init__(self, threshold=240, min_area=100, alpha_threshold=30, use_alpha=True, use_white=True,
+                 backend='scipy', tile_height=0, encode_workers=4, png_compress_level=6, fast_png_filter=False,
+                 export_mode='png', merge_distance=0, max_area=0, min_fill_ratio=0.0, max_aspect_ratio=0.0,
+                 centroid_region=None, write_stats=False, dedup_elements=False, trim_to_content=False):
+        self.threshold = threshold
+        # 过滤条件：像素面积、填充率、长宽比（0表示不限），质心区域为 (x0, y0, x1, y1) 或None
+        self.min_area = min_area
+        self.max_area = max_area
+        self.min_fill_ratio = min_fill_ratio
+        self.max_aspect_ratio = max_aspect_ratio
+        self.centroid_region = centroid_region
+        self.write_stats = write_stats  # 导出时同时写出统计表CSV
+        self.alpha_threshold = alpha_threshold
+        self.use_alpha = use_alpha
+        self.use_white = use_white
+        self.backend = COMPONENT_BACKENDS[backend]()
+        self.tile_height = tile_height  # 大于0时按条带分块处理
+        self.merge_distance = merge_distance  # 大于0时合并包围盒间距不超过该值的碎片
+        self._mask_buffers = None  # 前景掩码和临时缓冲区，按图像尺寸复用
+        self.encode_workers = encode_workers
+        self.png_compress_level = png_compress_level
+        self.fast_png_filter = fast_png_filter
+        self.export_mode = export_mode  # png: 每个元素一个文件; manifest: 仅JSON清单; zip: 清单+不压缩ZIP
+        self.dedup_elements = dedup_elements  # 按内容哈希去重，相同元素只写出一次
+        self.trim_to_content = trim_to_content  # 只裁掉透明/白色边距，不做连通域分割
+
+    def __getstate__(self):
+        # 传给子进程时不携带掩码缓冲区
+        state = self.__dict__.copy()
+        state['_mask_buffers'] = None
+        return state
+
+    def estimate_memory(self, image_path):
+        """根据图像头信息估算处理单张图片的峰值内存（字节）"""
+        try:
+            if image_path.lower().endswith('.npy'):
+                height, width = np.load(image_path, mmap_mode='r').shape[:2]
+                decoded_bytes = 0
+            else:
+                max_pixels = Image.MAX_IMAGE_PIXELS
+                Image.MAX_IMAGE_PIXELS = None
+                try:
+                    with Image.open(image_path) as image:
+                        width, height = image.size
+                finally:
+                    Image.MAX_IMAGE_PIXELS = max_pixels
+                decoded_bytes = width * height * 4
+        except Exception:
+            return 0
+        # 每像素: RGBA副本4 + 掩码和临时缓冲2 + int32标记4 + 坐标和权重8 + 导出裁剪约4
+        working_rows = min(height, self.tile_height) if self.tile_height > 0 else height
+        return decoded_bytes + width * working_rows * 22
+
+    def compute_foreground_mask(self, image_array):
+        """根据背景检测条件生成前景二值图（1为前景），结果写入复用的缓冲区"""
+        shape = image_array.shape[:2]
+        if self._mask_buffers is None or self._mask_buffers[0].shape != shape:
+            self._mask_buffers = (np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8))
+        out, scratch = self._mask_buffers
+        return compute_foreground_mask(image_array, self.threshold, self.alpha_threshold, self.use_alpha,
+                                       self.use_white, out, scratch)
+
+    def find_components(self, binary_image):
+        """单次扫描统计全部连通域，返回统计表 [x, y, 宽, 高, 像素数]"""
+        _, stats = self.backend.compute_stats(binary_image)
+        return stats
+
+    def find_components_tiled(self, source):
+        """逐条带标记连通域并合并接缝，峰值内存只与条带大小有关"""
+        strip_stats = []
+        seam_pairs = []
+        previous_last_row = None  # 上一条带最后一行的全局标记
+        label_offset = 0
+
+        for y0 in range(0, source.height, self.tile_height):
+            y1 = min(source.height, y0 + self.tile_height)
+            binary_image = self.compute_foreground_mask(source.read_rows(y0, y1))
+            labeled_array, stats = self.backend.compute_stats(binary_image)
+            stats[:, 1] += y0
+            stats[:, 6] += y0 * stats[:, 4]
+
+            first_row = labeled_array[0].astype(np.int64)
+            first_row[first_row > 0] += label_offset
+            if previous_last_row is not None:
+                # 上下相邻的前景像素属于同一连通域（4连通）
+                touching = (previous_last_row > 0) & (first_row > 0)
+                if touching.any():
+                    pairs = np.stack((previous_last_row[touching], first_row[touching]), axis=1)
+                    seam_pairs.extend(np.unique(pairs, axis=0).tolist())
+
+            previous_last_row = labeled_array[-1].astype(np.int64)
+            previous_last_row[previous_last_row > 0] += label_offset
+            label_offset += len(stats)
+            strip_stats.append(stats)
+            del binary_image, labeled_array
+
+        return merge_strip_components(strip_stats, seam_pairs)
+
+    def merge_components(self, stats):
+        """单链接合并包围盒间距不超过merge_distance的连通域（包围盒取并集，像素数相加）"""
+        if self.merge_distance <= 0:
+            return stats
+        return merge_strip_components([stats], find_nearby_pairs(stats, self.merge_distance))
+
+    def component_mask(self, stats):
+        """按像素面积、填充率、长宽比和质心区域计算保留掩码"""
+        values = component_statistics(stats)
+        keep = values['pixel_count'] >= self.min_area
+        if self.max_area > 0:
+            keep &= values['pixel_count'] <= self.max_area
+        if self.min_fill_ratio > 0:
+            keep &= values['fill_ratio'] >= self.min_fill_ratio
+        if self.max_aspect_ratio > 0:
+            keep &= values['aspect_ratio'] <= self.max_aspect_ratio
+        if self.centroid_region is not None:
+            x0, y0, x1, y1 = self.centroid_region
+            keep &= ((values['centroid_x'] >= x0) & (values['centroid_x'] < x1) &
+                     (values['centroid_y'] >= y0) & (values['centroid_y'] < y1))
+        return keep
+
+    def filter_components(self, stats):
+        """过滤连通域，返回保留的统计行"""
+        return stats[self.component_mask(stats)]
+
+    def select_components(self, stats, base_name, output_dir):
+        """过滤连通域，需要时把全部连通域的统计表写到导出目录"""
+        keep = self.component_mask(stats)
+        if self.write_stats:
+            write_component_stats(stats, keep, os.path.join(output_dir, f"{base_name}_stats.csv"))
+        return stats[keep]
+
+    def write_png(self, region, output_path):
+        """编码并写出单个元素（OpenCV编码期间释放GIL，可在线程池中并行），写入通过临时文件原子替换"""
+        write_file_atomic(self.encode_region(region), output_path)
+
+    def encode_region(self, region):
+        return encode_png(region, self.png_compress_level, self.fast_png_filter)
+
+    def write_png_once(self, region, output_path):
+        """去重模式下写出元素：已存在则跳过，写入通过临时文件原子替换"""
+        if not os.path.exists(output_path):
+            write_file_atomic(self.encode_region(region), output_path)
+
+    def encode_named(self, name, region):
+        return name, self.encode_region(region)
+
+    def iter_export_regions(self, components, read_region, names, digests):
+        """依次裁剪元素并产出需要编码的 (名称, 区域)
+
+        去重模式下按内容哈希命名，names原地改为哈希文件名，重复内容只产出第一次。
+        """
+        seen = set()
+        for idx, component in enumerate(components):
+            region = read_region(component)
+            if self.dedup_elements:
+                digest = hash_element(region)
+                digests.append(digest)
+                names[idx] = f"{digest}.png"
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            yield names[idx], region
+
+    def run_encode_jobs(self, jobs, consume):
+        """在有界线程池中执行编码任务，并按提交顺序把结果交给consume"""
+        workers = max(1, self.encode_workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for job in jobs:
+                # 限制排队中的元素数量，避免裁剪结果堆积占用内存
+                if len(pending) >= 2 * workers:
+                    consume(pending.popleft().result())
+                pending.append(pool.submit(*job))
+            while pending:
+                consume(pending.popleft().result())
+
+    def export_components(self, components, read_region, base_name, output_dir, image_path='', image_size=(0, 0)):
+        """按导出方式写出元素，文件名和清单顺序由元素序号决定"""
+        names = [f"{base_name}_element_{idx+1}.png" for idx in range(len(components))]
+        digests = []
+        regions = self.iter_export_regions(components, read_region, names, digests)
+        if self.export_mode == 'png':
+            if not self.dedup_elements:
+                jobs = ((self.write_png, region, os.path.join(output_dir, name)) for name, region in regions)
+                self.run_encode_jobs(jobs, lambda _: None)
+                return
+            # 哈希命名的文件可跨图片共享，清单记录每次出现对应的文件
+            jobs = ((self.write_png_once, region, os.path.join(output_dir, name)) for name, region in regions)
+            self.run_encode_jobs(jobs, lambda _: None)
+
+        container = None
+        if self.export_mode == 'zip':
+            # 所有元素以不压缩方式存入单个ZIP，下游可按偏移直接读取PNG数据
+            container = f"{base_name}_elements.zip"
+            container_path = os.path.join(output_dir, container)
+            with zipfile.ZipFile(container_path, 'w', zipfile.ZIP_STORED) as archive:
+                jobs = ((self.encode_named, name, region) for name, region in regions)
+                self.run_encode_jobs(jobs, lambda result: archive.writestr(*result))
+            entries = read_zip_data_offsets(container_path)
+        else:
+            entries = {}
+            if self.export_mode == 'manifest' and self.dedup_elements:
+                # 仅清单模式不编码，但仍记录内容哈希
+                for _ in regions:
+                    pass
+
+        elements = []
+        for idx, (component, name) in enumerate(zip(components, names)):
+            x, y, w, h, pixel_count, sum_x, sum_y = (int(value) for value in component[:STAT_COLUMNS])
+            element = {'index': idx + 1, 'bbox': [x, y, w, h], 'pixel_count': pixel_count,
+                       'centroid': [round(sum_x / pixel_count, 3), round(sum_y / pixel_count, 3)]}
+            if digests:
+                element['hash'] = digests[idx]
+            if container:
+                element['name'] = name
+                element['offset'], element['length'] = entries[name]
+            elif self.export_mode == 'png':
+                element['name'] = name
+            elements.append(element)
+
+        manifest = {
+            'source': os.path.abspath(image_path) if image_path else '',
+            'width': image_size[0],
+            'height': image_size[1],
+            'container': container,
+            'elements': elements,
+        }
+        with open(os.path.join(output_dir, f"{base_name}_manifest.json"), "w", encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+    def process_image_tiled(self, image_path, output_dir):
+        """分块处理超大图片并导出元素，返回导出的元素数量"""
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        source = ImageStripSource(image_path)
+        try:
+            components = self.select_components(self.merge_components(self.find_components_tiled(source)),
+                                                base_name, output_dir)
+
+            # 导出元素，每个元素只读取其包围盒区域
+            self.export_components(
+                components, lambda c: source.read_rows(c[1], c[1]+c[3], c[0], c[0]+c[2]),
+                base_name, output_dir, image_path, (source.width, source.height))
+        finally:
+            source.close()
+        return len(components)
+
+    def find_content_bounds(self, binary_image):
+        """由掩码的行、列投影求内容包围盒，无需标记连通域"""
+        return content_bounds(binary_image.any(axis=1), binary_image.any(axis=0))
+
+    def find_content_bounds_tiled(self, source):
+        """逐条带累积行、列投影求内容包围盒"""
+        row_any = np.zeros(source.height, dtype=bool)
+        column_any = np.zeros(source.width, dtype=bool)
+        for y0 in range(0, source.height, self.tile_height):
+            y1 = min(source.height, y0 + self.tile_height)
+            binary_image = self.compute_foreground_mask(source.read_rows(y0, y1))
+            row_any[y0:y1] = binary_image.any(axis=1)
+            column_any |= binary_image.any(axis=0)
+        return content_bounds(row_any, column_any)
+
+    def trim_image(self, image_path, output_dir):
+        """裁剪到内容：PNG方式写出裁剪后的图片，其他方式只写偏移清单，返回导出数量（0或1）"""
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        source = ImageStripSource(image_path) if self.tile_height > 0 else None
+        try:
+            if source is not None:
+                bounds = self.find_content_bounds_tiled(source)
+                image_size = (source.width, source.height)
+                read_region = lambda x, y, w, h: source.read_rows(y, y + h, x, x + w)
+            else:
+                image_array = np.array(Image.open(image_path).convert('RGBA'))
+                bounds = self.find_content_bounds(self.compute_foreground_mask(image_array))
+                image_size = (image_array.shape[1], image_array.shape[0])
+                read_region = lambda x, y, w, h: image_array[y:y + h, x:x + w]
+
+            if bounds is None:
+                return 0
+            if self.export_mode == 'png':
+                self.write_png(read_region(*bounds), os.path.join(output_dir, f"{base_name}_trimmed.png"))
+            else:
+                manifest = {
+                    'source': os.path.abspath(image_path),
+                    'width': image_size[0],
+                    'height': image_size[1],
+                    'bbox': list(bounds),
+                }
+                with open(os.path.join(output_dir, f"{base_name}_manifest.json"), "w", encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False)
+        finally:
+            if source is not None:
+                source.close()
+        return 1
+
+    def process_image(self, image_path, output_dir):
+        """处理单张图片并导出元素，返回导出的元素数量"""
+        if self.trim_to_content:
+            return self.trim_image(image_path, output_dir)
+        if self.tile_height > 0:
+            return self.process_image_tiled(image_path, output_dir)
+
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        original_image = Image.open(image_path).convert('RGBA')
+        image_array = np.array(original_image)
+
+        # 创建二值化图像并查找连通区域
+        binary_image = self.compute_foreground_mask(image_array)
+        components = self.select_components(self.merge_components(self.find_components(binary_image)),
+                                            base_name, output_dir)
+
+        # 导出元素
+        self.export_components(
+            components, lambda c: image_array[c[1]:c[1]+c[3], c[0]:c[0]+c[2]],
+            base_name, output_dir, image_path, original_image.size)
+        return len(components)
+
+def process_image_job(extractor, image_path, output_dir):
+    """进程池任务：在子进程中处理单张图片"""
+    return extractor.process_image(image_path, output_dir)
 
 class ProcessingThread(QThread):
     progress_updated = pyqtSignal(int, str)
     finished = pyqtSignal(int, int)  # 成功数量, 总数量
     
-    def __init__(self, image_paths, output_dir, threshold, min_area, alpha_threshold, use_alpha, use_white):
+    def __init__(self, image_paths, output_dir, threshold, min_area, alpha_threshold, use_alpha, use_white,
+                 backend='scipy', tile_height=0, encode_workers=4, png_compress_level=6, fast_png_filter=False,
+                 export_mode='png', process_workers=1, memory_budget_mb=4096, merge_distance=0,
+                 max_area=0, min_fill_ratio=0.0, max_aspect_ratio=0.0, write_stats=False, dedup_elements=False,
+                 trim_to_content=False, centroid_region=None):
         super().__init__()
         self.image_paths = image_paths
         self.output_dir = output_dir
-        self.threshold = threshold
-        self.min_area = min_area
-        self.alpha_threshold = alpha_threshold
-        self.use_alpha = use_alpha
-        self.use_white = use_white
+        self.extractor = ElementExtractor(threshold, min_area, alpha_threshold, use_alpha, use_white, backend,
+                                          tile_height, encode_workers, png_compress_level, fast_png_filter,
+                                          export_mode, merge_distance, max_area, min_fill_ratio,
+                                          max_aspect_ratio, centroid_region, write_stats=write_stats,
+                                          dedup_elements=dedup_elements, trim_to_content=trim_to_content)
+        self.process_workers = process_workers
+        self.memory_budget = memory_budget_mb * 1024 * 1024
         self.success_count = 0
         self.is_running = True  # 添加运行状态标志
         
     def run(self):
+        if self.process_workers > 1:
+            try:
+                self.run_parallel()
+            finally:
+                # 无论是否出错都要通知界面，否则控件会一直保持禁用状态
+                self.finished.emit(self.success_count, len(self.image_paths))
+            return
+
         total = len(self.image_paths)
         for i, image_path in enumerate(self.image_paths):
             if not self.is_running:  # 检查是否应该停止
@@ -34,74 +719,155 @@ class ProcessingThread(QThread):
                 self.progress_updated.emit(i + 1, f"正在处理: {os.path.basename(image_path)}")
                 
                 # 处理单张图片
-                base_name = os.path.splitext(os.path.basename(image_path))[0]
-                original_image = Image.open(image_path).convert('RGBA')
-                image_array = np.array(original_image)
-                height, width, _ = image_array.shape
-
-                # 创建二值化图像
-                binary_image = np.zeros((height, width), dtype=np.uint8)
-                r, g, b, a = image_array[:,:,0], image_array[:,:,1], image_array[:,:,2], image_array[:,:,3]
-                
-                # 背景检测条件
-                background_mask_alpha = a < self.alpha_threshold
-                background_mask_white = (r > self.threshold) & (g > self.threshold) & (b > self.threshold) & (a > 200)
-                
-                # 合并背景条件
-                if self.use_alpha and self.use_white:
-                    background_mask = background_mask_alpha | background_mask_white
-                elif self.use_alpha:
-                    background_mask = background_mask_alpha
-                elif self.use_white:
-                    background_mask = background_mask_white
-                else:
-                    # 如果没有选择任何背景检测方式，默认使用alpha检测
-                    background_mask = background_mask_alpha
-                    
-                binary_image[background_mask] = 0
-                binary_image[~background_mask] = 1
-
-                # 查找连通区域 - 使用更高效的算法
-                from scipy import ndimage
-                labeled_array, num_features = ndimage.label(binary_image)
-                
-                components = []
-                for i in range(1, num_features + 1):
-                    points = np.where(labeled_array == i)
-                    if len(points[0]) > 0:
-                        ys, xs = points
-                        min_x, max_x = np.min(xs), np.max(xs)
-                        min_y, max_y = np.min(ys), np.max(ys)
-                        comp_width = max_x - min_x + 1
-                        comp_height = max_y - min_y + 1
-                        area = comp_width * comp_height
-                        if area >= self.min_area:
-                            components.append((min_x, min_y, max_x, max_y))
-
-                # 导出元素
-                for idx, bbox in enumerate(components):
-                    min_x, min_y, max_x, max_y = bbox
-                    element_region = original_image.crop((min_x, min_y, max_x+1, max_y+1))
-                    output_filename = f"{base_name}_element_{idx+1}.png"
-                    output_path = os.path.join(self.output_dir, output_filename)
-                    element_region.save(output_path, 'PNG')
-                
+                self.extractor.process_image(image_path, self.output_dir)
                 self.success_count += 1
                 
             except Exception as e:
                 self.progress_updated.emit(i + 1, f"处理失败: {os.path.basename(image_path)} - {str(e)}")
         
         self.finished.emit(self.success_count, total)
-        
+
+    def run_parallel(self):
+        """多进程并行处理整张图片，按内存预算控制同时加载的图片"""
+        completed = 0
+        in_flight_memory = 0
+        pending = {}  # future -> (图片路径, 估算内存)
+        queue = iter(self.image_paths)
+        next_path = next(queue, None)
+
+        # spawn方式启动子进程，避免在带有Qt线程的进程中fork
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.process_workers, mp_context=context) as pool:
+            try:
+                while True:
+                    # 在不超出内存预算的前提下提交新图片（始终允许至少一张在处理）
+                    while self.is_running and next_path is not None and len(pending) < self.process_workers:
+                        estimate = self.extractor.estimate_memory(next_path)
+                        if pending and in_flight_memory + estimate > self.memory_budget:
+                            break
+                        future = pool.submit(process_image_job, self.extractor, next_path, self.output_dir)
+                        pending[future] = (next_path, estimate)
+                        in_flight_memory += estimate
+                        self.progress_updated.emit(completed, f"正在处理: {os.path.basename(next_path)}")
+                        next_path = next(queue, None)
+
+                    if not pending:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        image_path, estimate = pending.pop(future)
+                        in_flight_memory -= estimate
+                        completed += 1
+                        try:
+                            future.result()
+                            self.success_count += 1
+                            self.progress_updated.emit(completed, f"已完成: {os.path.basename(image_path)}")
+                        except Exception as e:
+                            self.progress_updated.emit(completed, f"处理失败: {os.path.basename(image_path)} - {str(e)}")
+            except Exception as e:
+                # 工作进程异常退出（如超大图片导致被系统OOM终止）后进程池不可再用，剩余图片都记为失败
+                failed = [image_path for image_path, _ in pending.values()]
+                if self.is_running and next_path is not None:
+                    failed += [next_path, *queue]
+                for image_path in failed:
+                    completed += 1
+                    self.progress_updated.emit(completed, f"处理失败: {os.path.basename(image_path)} - 工作进程异常退出: {e}")
+
     def stop(self):
         self.is_running = False
 
+class NpyConversionThread(QThread):
+    """后台把图片转换为.npy，供分块处理按条带内存映射读取"""
+    progress_updated = pyqtSignal(int, str)
+    finished = pyqtSignal(list)  # [(原路径, .npy路径)]
+
+    def __init__(self, image_paths, output_dir, strip_height=1024):
+        super().__init__()
+        self.image_paths = image_paths
+        self.output_dir = output_dir
+        self.strip_height = strip_height
+
+    def run(self):
+        converted = []
+        for i, image_path in enumerate(self.image_paths):
+            self.progress_updated.emit(i, f"正在转换: {os.path.basename(image_path)}")
+            npy_path = os.path.join(self.output_dir, os.path.splitext(os.path.basename(image_path))[0] + '.npy')
+            try:
+                ImageStripSource.convert_to_npy(image_path, npy_path, self.strip_height)
+                converted.append((image_path, npy_path))
+            except Exception as e:
+                print(f"转换.npy错误 {image_path}: {str(e)}")
+                if os.path.exists(npy_path):
+                    os.remove(npy_path)
+        self.progress_updated.emit(len(self.image_paths), f"已转换 {len(converted)}/{len(self.image_paths)} 张图片")
+        self.finished.emit(converted)
+
+PREVIEW_PROXY_SIZE = 1024  # 预览代理图的最长边
+
+def load_preview_proxy(image_path, max_size=PREVIEW_PROXY_SIZE):
+    """加载降采样的RGBA代理图，返回 (代理数组, 代理/原图缩放比例, 原图尺寸)"""
+    max_pixels = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        with Image.open(image_path) as image:
+            original_size = image.size
+            image.draft('RGBA', (max_size, max_size))
+            proxy = image.convert('RGBA')
+    finally:
+        Image.MAX_IMAGE_PIXELS = max_pixels
+    proxy.thumbnail((max_size, max_size), Image.BOX)
+    scale = proxy.size[0] / original_size[0]
+    return np.array(proxy), scale, original_size
+
+class PreviewThread(QThread):
+    """在代理图上检测元素包围盒，供预览叠加显示"""
+    boxes_ready = pyqtSignal(object, int)  # 原图坐标的统计表, 请求序号
+
+    def __init__(self, extractor, proxy_array, scale, request_id):
+        super().__init__()
+        self.extractor = extractor
+        self.proxy_array = proxy_array
+        self.scale = scale
+        self.request_id = request_id
+
+    def run(self):
+        try:
+            binary_image = self.extractor.compute_foreground_mask(self.proxy_array)
+            if self.extractor.trim_to_content:
+                bounds = self.extractor.find_content_bounds(binary_image)
+                components = np.array([bounds] if bounds else [], dtype=np.int64).reshape(-1, 4)
+            else:
+                components = self.extractor.find_components(binary_image)
+                components = self.extractor.filter_components(self.extractor.merge_components(components))
+            # 包围盒换算回原图坐标（外扩取整，保证覆盖元素）
+            boxes = np.empty((len(components), 4), dtype=np.int64)
+            boxes[:, 0:2] = np.floor(components[:, 0:2] / self.scale)
+            boxes[:, 2:4] = np.ceil((components[:, 0:2] + components[:, 2:4]) / self.scale) - boxes[:, 0:2]
+            self.boxes_ready.emit(boxes, self.request_id)
+        except Exception as e:
+            print(f"预览检测错误: {str(e)}")
+            self.boxes_ready.emit(None, self.request_id)
+
 class ImageSegmentationController(QMainWindow):
     def __init__(self):
         super().__init__()
         self.image_paths = []
         self.output_dir = ""
         self.processing_thread = None
+        self.conversion_thread = None
+        # 预览缓存：代理图只在切换图片时加载，参数变化时仅重算掩码
+        self.preview_proxy = None
+        self.preview_scale = 1.0
+        self.preview_size = (0, 0)
+        self.preview_pixmap = None
+        self.preview_extractor = ElementExtractor()
+        self.preview_thread = None
+        self.preview_request_id = 0
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(50)
+        self.preview_timer.timeout.connect(self.update_preview_boxes)
         self.initUI()
 
     def initUI(self):
@@ -132,6 +898,9 @@ class ImageSegmentationController(QMainWindow):
         top_layout.addWidget(self.btn_output)
         top_layout.addWidget(self.btn_export)
         top_layout.addWidget(self.btn_stop)
+        self.btn_pack = QPushButton('打包图集')
+        self.btn_pack.clicked.connect(self.open_atlas_packer)
+        top_layout.addWidget(self.btn_pack)
         main_layout.addLayout(top_layout)
 
         # 分割器：左侧图片列表，右侧预览和参数
@@ -201,7 +970,60 @@ class ImageSegmentationController(QMainWindow):
         self.spin_min_area.setValue(100)
         area_layout.addWidget(self.spin_min_area)
         area_layout.addWidget(QLabel('像素'))
+        area_layout.addWidget(QLabel('最大:'))
+        self.spin_max_area = QSpinBox()
+        self.spin_max_area.setRange(0, 100000000)
+        self.spin_max_area.setValue(0)
+        self.spin_max_area.setSpecialValueText('不限')
+        area_layout.addWidget(self.spin_max_area)
+        area_layout.addWidget(QLabel('合并间距:'))
+        self.spin_merge_distance = QSpinBox()
+        self.spin_merge_distance.setRange(0, 500)
+        self.spin_merge_distance.setValue(0)
+        area_layout.addWidget(self.spin_merge_distance)
+        area_layout.addWidget(QLabel('像素'))
+        self.cb_trim = QCheckBox('仅裁剪到内容')
+        self.cb_trim.setToolTip('只裁掉透明/白色边距，不分割元素')
+        area_layout.addWidget(self.cb_trim)
+        self.cb_show_boxes = QCheckBox('预览检测框')
+        self.cb_show_boxes.setChecked(True)
+        area_layout.addWidget(self.cb_show_boxes)
         params_layout.addLayout(area_layout)
+
+        # 形状过滤
+        shape_layout = QHBoxLayout()
+        shape_layout.addWidget(QLabel('最小填充率:'))
+        self.spin_min_fill = QDoubleSpinBox()
+        self.spin_min_fill.setRange(0.0, 1.0)
+        self.spin_min_fill.setSingleStep(0.05)
+        self.spin_min_fill.setValue(0.0)
+        shape_layout.addWidget(self.spin_min_fill)
+        shape_layout.addWidget(QLabel('最大长宽比:'))
+        self.spin_max_aspect = QDoubleSpinBox()
+        self.spin_max_aspect.setRange(0.0, 1000.0)
+        self.spin_max_aspect.setSingleStep(0.5)
+        self.spin_max_aspect.setValue(0.0)
+        self.spin_max_aspect.setSpecialValueText('不限')
+        shape_layout.addWidget(self.spin_max_aspect)
+        self.cb_write_stats = QCheckBox('导出统计表(CSV)')
+        shape_layout.addWidget(self.cb_write_stats)
+        shape_layout.addStretch()
+        params_layout.addLayout(shape_layout)
+
+        # 质心区域过滤（原图坐标，左上含、右下不含）
+        centroid_layout = QHBoxLayout()
+        self.cb_centroid_region = QCheckBox('只保留质心在区域内的元素')
+        centroid_layout.addWidget(self.cb_centroid_region)
+        self.spin_centroid_region = []
+        for label, value in (('左:', 0), ('上:', 0), ('右:', 1000000), ('下:', 1000000)):
+            centroid_layout.addWidget(QLabel(label))
+            spin = QSpinBox()
+            spin.setRange(0, 1000000)
+            spin.setValue(value)
+            centroid_layout.addWidget(spin)
+            self.spin_centroid_region.append(spin)
+        centroid_layout.addStretch()
+        params_layout.addLayout(centroid_layout)
         
         # 选项复选框
         options_layout = QHBoxLayout()
@@ -212,8 +1034,72 @@ class ImageSegmentationController(QMainWindow):
         self.cb_use_white = QCheckBox('排除白色背景')
         self.cb_use_white.setChecked(True)
         options_layout.addWidget(self.cb_use_white)
+
+        options_layout.addWidget(QLabel('连通域算法:'))
+        self.combo_backend = QComboBox()
+        self.combo_backend.addItems(list(COMPONENT_BACKENDS.keys()))
+        options_layout.addWidget(self.combo_backend)
         
         params_layout.addLayout(options_layout)
+
+        # 分块处理参数
+        tile_layout = QHBoxLayout()
+        self.cb_tiled = QCheckBox('分块处理超大图片')
+        self.cb_tiled.setToolTip("只有.npy文件按条带内存映射读取，PNG/JPEG仍会完整解码；超大图集请先转换为.npy")
+        tile_layout.addWidget(self.cb_tiled)
+        tile_layout.addWidget(QLabel('条带高度:'))
+        self.spin_tile_height = QSpinBox()
+        self.spin_tile_height.setRange(64, 16384)
+        self.spin_tile_height.setValue(2048)
+        tile_layout.addWidget(self.spin_tile_height)
+        tile_layout.addWidget(QLabel('行'))
+        self.btn_convert_npy = QPushButton('转换为.npy')
+        self.btn_convert_npy.setToolTip("把列表中的图片转换为.npy保存到输出目录并替换列表项，"
+                                        "转换时仍需完整解码一次，之后分块处理的内存只与条带高度有关")
+        self.btn_convert_npy.clicked.connect(self.convert_to_npy)
+        tile_layout.addWidget(self.btn_convert_npy)
+        tile_layout.addStretch()
+        params_layout.addLayout(tile_layout)
+
+        # 导出编码参数
+        encode_layout = QHBoxLayout()
+        encode_layout.addWidget(QLabel('编码线程:'))
+        self.spin_encode_workers = QSpinBox()
+        self.spin_encode_workers.setRange(1, 32)
+        self.spin_encode_workers.setValue(min(4, os.cpu_count() or 1))
+        encode_layout.addWidget(self.spin_encode_workers)
+        encode_layout.addWidget(QLabel('PNG压缩级别:'))
+        self.spin_png_level = QSpinBox()
+        self.spin_png_level.setRange(0, 9)
+        self.spin_png_level.setValue(6)
+        encode_layout.addWidget(self.spin_png_level)
+        self.cb_fast_png = QCheckBox('快速PNG滤波')
+        encode_layout.addWidget(self.cb_fast_png)
+        encode_layout.addWidget(QLabel('导出方式:'))
+        self.combo_export_mode = QComboBox()
+        self.combo_export_mode.addItems(list(EXPORT_MODES.keys()))
+        encode_layout.addWidget(self.combo_export_mode)
+        self.cb_dedup_elements = QCheckBox('相同元素只导出一次')
+        encode_layout.addWidget(self.cb_dedup_elements)
+        encode_layout.addStretch()
+        params_layout.addLayout(encode_layout)
+
+        # 多进程参数
+        parallel_layout = QHBoxLayout()
+        parallel_layout.addWidget(QLabel('并行进程:'))
+        self.spin_process_workers = QSpinBox()
+        self.spin_process_workers.setRange(1, os.cpu_count() or 1)
+        self.spin_process_workers.setValue(1)
+        parallel_layout.addWidget(self.spin_process_workers)
+        parallel_layout.addWidget(QLabel('内存预算:'))
+        self.spin_memory_budget = QSpinBox()
+        self.spin_memory_budget.setRange(256, 1024 * 1024)
+        self.spin_memory_budget.setSingleStep(256)
+        self.spin_memory_budget.setValue(4096)
+        parallel_layout.addWidget(self.spin_memory_budget)
+        parallel_layout.addWidget(QLabel('MB'))
+        parallel_layout.addStretch()
+        params_layout.addLayout(parallel_layout)
         params_group.setLayout(params_layout)
         right_layout.addWidget(params_group)
         
@@ -229,6 +1115,18 @@ class ImageSegmentationController(QMainWindow):
         self.lbl_status = QLabel('准备就绪')
         main_layout.addWidget(self.lbl_status)
 
+        # 参数变化时刷新预览检测框（防抖）
+        for signal in (self.slider_threshold.valueChanged, self.slider_alpha.valueChanged,
+                       self.spin_min_area.valueChanged, self.spin_max_area.valueChanged,
+                       self.spin_min_fill.valueChanged, self.spin_max_aspect.valueChanged,
+                       self.spin_merge_distance.valueChanged, self.cb_trim.stateChanged,
+                       self.cb_centroid_region.stateChanged,
+                       *(spin.valueChanged for spin in self.spin_centroid_region),
+                       self.cb_use_alpha.stateChanged,
+                       self.cb_use_white.stateChanged, self.cb_show_boxes.stateChanged,
+                       self.combo_backend.currentIndexChanged):
+            signal.connect(self.schedule_preview_update)
+
     def update_threshold_label(self):
         self.lbl_threshold.setText(str(self.slider_threshold.value()))
         
@@ -238,7 +1136,7 @@ class ImageSegmentationController(QMainWindow):
     def add_images(self):
         files, _ = QFileDialog.getOpenFileNames(
             self, "选择图片", "",
-            "图片文件 (*.png *.jpg *.jpeg *.bmp);;所有文件 (*)"
+            "图片文件 (*.png *.jpg *.jpeg *.bmp);;RGBA数组 (*.npy);;所有文件 (*)"
         )
         if not files:
             return
@@ -263,6 +1161,8 @@ class ImageSegmentationController(QMainWindow):
     def clear_list(self):
         self.list_images.clear()
         self.image_paths = []
+        self.preview_proxy = None
+        self.preview_pixmap = None
         self.lbl_preview.setText("请选择图片")
         self.lbl_info.setText("未选择图片")
         self.update_export_button()
@@ -305,10 +1205,75 @@ class ImageSegmentationController(QMainWindow):
                 Qt.SmoothTransformation
             )
             self.lbl_preview.setPixmap(scaled_pixmap)
+
+            # 缓存预览底图和降采样代理图，随后在后台计算检测框
+            self.preview_pixmap = scaled_pixmap
+            self.preview_proxy, self.preview_scale, self.preview_size = load_preview_proxy(image_path)
+            self.schedule_preview_update()
         except Exception as e:
+            self.preview_proxy = None
+            self.preview_pixmap = None
             self.lbl_preview.setText("图片加载失败")
             self.lbl_info.setText(f"错误: {str(e)}")
 
+    def schedule_preview_update(self):
+        """参数变化后延迟刷新检测框，连续拖动滑块时只计算最后一次"""
+        if self.preview_proxy is not None:
+            self.preview_timer.start()
+
+    def update_preview_boxes(self):
+        if self.preview_proxy is None:
+            return
+        if not self.cb_show_boxes.isChecked():
+            self.lbl_preview.setPixmap(self.preview_pixmap)
+            return
+        # 上一次计算未结束时稍后重试，避免共享的掩码缓冲区被并发写入
+        if self.preview_thread and self.preview_thread.isRunning():
+            self.preview_timer.start()
+            return
+
+        extractor = self.preview_extractor
+        extractor.threshold = self.slider_threshold.value()
+        extractor.alpha_threshold = self.slider_alpha.value()
+        extractor.use_alpha = self.cb_use_alpha.isChecked()
+        extractor.use_white = self.cb_use_white.isChecked()
+        extractor.backend = COMPONENT_BACKENDS[self.combo_backend.currentText()]()
+        # 面积阈值按代理图缩放比例的平方换算
+        extractor.min_area = max(1, int(round(self.spin_min_area.value() * self.preview_scale ** 2)))
+        if self.spin_max_area.value() > 0:
+            extractor.max_area = max(1, int(round(self.spin_max_area.value() * self.preview_scale ** 2)))
+        else:
+            extractor.max_area = 0
+        extractor.trim_to_content = self.cb_trim.isChecked()
+        extractor.min_fill_ratio = self.spin_min_fill.value()
+        extractor.max_aspect_ratio = self.spin_max_aspect.value()
+        centroid_region = self.centroid_region()
+        if centroid_region is not None:
+            centroid_region = tuple(value * self.preview_scale for value in centroid_region)
+        extractor.centroid_region = centroid_region
+        extractor.merge_distance = int(round(self.spin_merge_distance.value() * self.preview_scale))
+
+        self.preview_request_id += 1
+        self.preview_thread = PreviewThread(extractor, self.preview_proxy, self.preview_scale,
+                                            self.preview_request_id)
+        self.preview_thread.boxes_ready.connect(self.on_preview_boxes_ready)
+        self.preview_thread.start()
+
+    def on_preview_boxes_ready(self, boxes, request_id):
+        # 忽略已过期的结果（期间切换了图片或参数）
+        if request_id != self.preview_request_id or self.preview_pixmap is None or boxes is None:
+            return
+
+        pixmap = self.preview_pixmap.copy()
+        display_scale = pixmap.width() / self.preview_size[0]
+        painter = QPainter(pixmap)
+        painter.setPen(QPen(QColor(255, 0, 0), 1))
+        for x, y, w, h in (boxes * display_scale).astype(np.int64):
+            painter.drawRect(x, y, max(1, w), max(1, h))
+        painter.end()
+        self.lbl_preview.setPixmap(pixmap)
+        self.lbl_status.setText(f"预览检测到 {len(boxes)} 个元素")
+
     def export_elements(self):
         if not self.image_paths:
             QMessageBox.warning(self, "警告", "请先添加图片！")
@@ -332,6 +1297,22 @@ class ImageSegmentationController(QMainWindow):
         alpha_threshold = self.slider_alpha.value()
         use_alpha = self.cb_use_alpha.isChecked()
         use_white = self.cb_use_white.isChecked()
+        backend = self.combo_backend.currentText()
+        tile_height = self.spin_tile_height.value() if self.cb_tiled.isChecked() else 0
+        encode_workers = self.spin_encode_workers.value()
+        png_compress_level = self.spin_png_level.value()
+        fast_png_filter = self.cb_fast_png.isChecked()
+        export_mode = EXPORT_MODES[self.combo_export_mode.currentText()]
+        process_workers = self.spin_process_workers.value()
+        memory_budget_mb = self.spin_memory_budget.value()
+        merge_distance = self.spin_merge_distance.value()
+        max_area = self.spin_max_area.value()
+        min_fill_ratio = self.spin_min_fill.value()
+        max_aspect_ratio = self.spin_max_aspect.value()
+        write_stats = self.cb_write_stats.isChecked()
+        dedup_elements = self.cb_dedup_elements.isChecked()
+        trim_to_content = self.cb_trim.isChecked()
+        centroid_region = self.centroid_region()
 
         # 禁用按钮，防止重复操作
         self.set_controls_enabled(False)
@@ -342,12 +1323,59 @@ class ImageSegmentationController(QMainWindow):
         # 创建处理线程
         self.processing_thread = ProcessingThread(
             self.image_paths, self.output_dir, threshold, min_area, 
-            alpha_threshold, use_alpha, use_white
+            alpha_threshold, use_alpha, use_white, backend, tile_height,
+            encode_workers, png_compress_level, fast_png_filter, export_mode,
+            process_workers, memory_budget_mb, merge_distance,
+            max_area, min_fill_ratio, max_aspect_ratio, write_stats, dedup_elements,
+            trim_to_content, centroid_region
         )
         self.processing_thread.progress_updated.connect(self.update_progress)
         self.processing_thread.finished.connect(self.on_processing_finished)
         self.processing_thread.start()
 
+    def convert_to_npy(self):
+        """把列表中的非.npy图片转换为.npy，完成后替换列表项并启用分块处理"""
+        image_paths = [path for path in self.image_paths if not path.lower().endswith('.npy')]
+        if not image_paths:
+            QMessageBox.warning(self, "警告", "列表中没有需要转换的图片！")
+            return
+        if not self.output_dir:
+            QMessageBox.warning(self, "警告", "请选择输出目录！")
+            return
+
+        self.set_controls_enabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setMaximum(len(image_paths))
+        self.conversion_thread = NpyConversionThread(image_paths, self.output_dir)
+        self.conversion_thread.progress_updated.connect(self.update_progress)
+        self.conversion_thread.finished.connect(self.on_conversion_finished)
+        self.conversion_thread.start()
+
+    def on_conversion_finished(self, converted):
+        self.progress_bar.setVisible(False)
+        self.set_controls_enabled(True)
+        replacements = dict(converted)
+        for row in range(self.list_images.count()):
+            item = self.list_images.item(row)
+            npy_path = replacements.get(item.data(Qt.UserRole))
+            if npy_path:
+                item.setText(os.path.basename(npy_path))
+                item.setData(Qt.UserRole, npy_path)
+        self.image_paths = [replacements.get(path, path) for path in self.image_paths]
+        if converted:
+            self.cb_tiled.setChecked(True)
+        self.lbl_status.setText(f"已转换 {len(converted)} 张图片为.npy，分块处理将按条带读取")
+
+    def open_atlas_packer(self):
+        """打开图集打包工具，输出目录中已导出的PNG元素会预先加入列表"""
+        from image_packing import AtlasPackingController
+        element_paths = []
+        if self.output_dir and os.path.isdir(self.output_dir):
+            element_paths = [os.path.join(self.output_dir, name) for name in sorted(os.listdir(self.output_dir))
+                             if name.lower().endswith('.png')]
+        self.packing_window = AtlasPackingController(element_paths)
+        self.packing_window.show()
+
     def stop_processing(self):
         if self.processing_thread and self.processing_thread.isRunning():
             self.processing_thread.stop()
@@ -373,11 +1401,18 @@ class ImageSegmentationController(QMainWindow):
         
         self.lbl_status.setText(f"处理完成: {success_count}/{total_count} 成功")
 
+    def centroid_region(self):
+        """界面中设置的质心区域 (x0, y0, x1, y1)，未启用时返回None"""
+        if not self.cb_centroid_region.isChecked():
+            return None
+        return tuple(spin.value() for spin in self.spin_centroid_region)
+
     def set_controls_enabled(self, enabled):
         self.btn_add.setEnabled(enabled)
         self.btn_clear.setEnabled(enabled)
         self.btn_output.setEnabled(enabled)
         self.btn_export.setEnabled(enabled)
+        self.btn_convert_npy.setEnabled(enabled)
         self.list_images.setEnabled(enabled)
 
     def closeEvent(self, event):
@@ -385,6 +1420,11 @@ class ImageSegmentationController(QMainWindow):
         if self.processing_thread and self.processing_thread.isRunning():
             self.processing_thread.stop()
             self.processing_thread.wait()
+        if self.conversion_thread and self.conversion_thread.isRunning():
+            self.conversion_thread.wait()
+        self.preview_timer.stop()
+        if self.preview_thread and self.preview_thread.isRunning():
+            self.preview_thread.wait()
         event.accept()
 
 if __name__ == '__main__':
@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+
+from file_utils import write_file_atomic
+
+
+class OutputCache:
+    """输出缓存清单：记录每个输入文件在某组操作参数下生成的输出，输入和参数都未变化且输出仍完整时跳过处理
+
+    清单保存在输出目录下，由图片压缩和格式转换共用。输入指纹默认使用 (文件大小, 修改时间)，
+    content_hash=True 时使用文件内容哈希（大小和修改时间未变时复用上次算出的哈希）。
+    每组参数各自记录输出，交替使用不同格式或参数时各自的输出互不影响。
+    处理过程中的检查点只把新条目追加到日志文件，结束时再把日志合并进清单，检查点开销与清单大小无关。
+    """
+    MANIFEST_NAME = '.imgkit_cache.json'
+    JOURNAL_NAME = '.imgkit_cache.journal'
+    VERSION = 2
+    HASH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, output_dir, content_hash=False):
+        self.output_dir = output_dir
+        self.content_hash = content_hash
+        self.manifest_path = os.path.join(output_dir, self.MANIFEST_NAME)
+        self.journal_path = os.path.join(output_dir, self.JOURNAL_NAME)
+        self.entries = {}
+        self.pending = {}  # 上次检查点之后记录的条目
+        self.computed_hashes = {}  # 本次运行查找时算出的内容哈希，记录输出时复用
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """读取清单并重放上次未合并的日志，文件不存在、损坏或版本不符时从空清单开始"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == self.VERSION:
+                self.entries = manifest.get('entries', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"读取缓存清单错误: {str(e)}")
+
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        version, key, entry = json.loads(line)
+                    except ValueError:
+                        break  # 中断时写了一半的最后一行
+                    if version == self.VERSION:
+                        self.entries[key] = entry
+                        self.dirty = True
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"读取缓存日志错误: {str(e)}")
+
+    def checkpoint(self):
+        """把上次检查点之后记录的条目追加到日志文件，中途中断时已完成的部分仍可跳过"""
+        if not self.pending:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        lines = ''.join(json.dumps([self.VERSION, key, entry], ensure_ascii=False) + '\n'
+                        for key, entry in self.pending.items())
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+        self.pending.clear()
+
+    def save(self):
+        """清单有变化时先写临时文件再原子替换并删除已合并的日志，中途中断不会留下损坏的清单"""
+        if not self.dirty:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = json.dumps({'version': self.VERSION, 'entries': self.entries}, ensure_ascii=False)
+        write_file_atomic(manifest.encode('utf-8'), self.manifest_path)
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+        self.pending.clear()
+        self.dirty = False
+
+    @staticmethod
+    def params_key(operation, params):
+        """操作名和参数的哈希，参数需可JSON序列化"""
+        text = json.dumps([operation, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def entry_key(self, input_path, operation, params):
+        return f"{operation}:{self.params_key(operation, params)}:{os.path.abspath(input_path)}"
+
+    def fingerprint(self, input_path, entry=None):
+        """输入文件指纹，内容哈希模式下文件大小和修改时间未变时沿用entry中已有的哈希"""
+        stat = os.stat(input_path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if not self.content_hash:
+            return signature
+        if entry and entry.get('stat') == signature and entry.get('content_hash'):
+            return entry['content_hash']
+        digest = hashlib.blake2b(digest_size=16)
+        with open(input_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        self.computed_hashes[os.path.abspath(input_path)] = {'stat': signature, 'content_hash': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def outputs_valid(self, outputs):
+        """记录的输出全部存在且大小与写入时一致"""
+        for name, size in outputs:
+            try:
+                if os.path.getsize(os.path.join(self.output_dir, name)) != size:
+                    return False
+            except OSError:
+                return False
+        return bool(outputs)
+
+    def lookup(self, input_path, operation, params):
+        """命中时返回已有输出路径列表，否则返回None；未命中时不删除任何文件，旧输出在新输出记录后才清理"""
+        entry = self.entries.get(self.entry_key(input_path, operation, params))
+        try:
+            fingerprint = self.fingerprint(input_path, entry)
+        except OSError:
+            self.misses += 1
+            return None
+        if entry and entry['fingerprint'] == fingerprint and self.outputs_valid(entry['outputs']):
+            self.hits += 1
+            self.computed_hashes.pop(os.path.abspath(input_path), None)
+            return [os.path.join(self.output_dir, name) for name, _ in entry['outputs']]
+        self.misses += 1
+        return None
+
+    def recorded_outputs(self, input_path, operation, params):
+        """相同参数下上次记录的输出路径列表，不检查输入是否变化，没有记录时返回空列表
+
+        输入变化后重新处理时写回这些路径，下游使用的输出文件名保持不变。
+        """
+        entry = self.entries.get(self.entry_key(input_path, operation, params))
+        return [os.path.join(self.output_dir, name) for name, _ in entry['outputs']] if entry else []
+
+    def store(self, input_path, operation, params, output_paths):
+        """记录一次成功处理的输出，output_paths可以是单个路径或路径列表
+
+        同一输入在相同参数下之前记录、且未被新输出覆盖写回的输出已过期，记录新输出后删除；其他参数下的输出保留。
+        """
+        if isinstance(output_paths, str):
+            output_paths = [output_paths]
+        try:
+            stat = os.stat(input_path)
+            fingerprint = self.fingerprint(input_path, self.computed_hashes.pop(os.path.abspath(input_path), None))
+            outputs = [[os.path.relpath(path, self.output_dir), os.path.getsize(path)] for path in output_paths]
+        except OSError as e:
+            print(f"记录缓存错误: {str(e)}")
+            return
+        entry = {'fingerprint': fingerprint, 'outputs': outputs}
+        if self.content_hash:
+            entry['stat'] = [stat.st_size, stat.st_mtime_ns]
+            entry['content_hash'] = fingerprint
+        key = self.entry_key(input_path, operation, params)
+        previous = self.entries.get(key)
+        self.entries[key] = entry
+        self.pending[key] = entry
+        self.dirty = True
+
+        if previous:
+            current = {name for name, _ in outputs}
+            for name, _ in previous['outputs']:
+                if name not in current:
+                    try:
+                        os.remove(os.path.join(self.output_dir, name))
+                    except OSError:
+                        pass
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0